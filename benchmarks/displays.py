@@ -0,0 +1,37 @@
+import django_filters
+
+from django_displayset import views as displayset_views
+from django_displayset.filterset import ParameterFilterSet
+
+from benchmarks.models import Address, Customer
+
+def customer(obj):
+	return u'%s %s' % (obj.first_name, obj.last_name)
+customer.admin_order_field = 'last_name'
+
+def city(obj):
+	return obj.address.city
+city.select_related = ('address',)
+city.admin_order_field = 'address__city'
+
+class CustomerDisplaySet(displayset_views.DisplaySet):
+	list_display = ('file', customer, city, 'date_added', 'is_open', 'balance')
+	search_fields = ('last_name', 'first_name', 'file', 'address__city', 'address__zip', 'contact__note')
+	list_per_page = 100
+	export = True
+	export_name = 'customers'
+
+class ConcurrentCustomerDisplaySet(CustomerDisplaySet):
+	concurrent_count = True
+
+class PlainCustomerDisplaySet(CustomerDisplaySet):
+	"Only plain fields, so fast_rows can skip model instances."
+	list_display = ('file', 'first_name', 'last_name', 'date_added', 'is_open', 'balance')
+
+class CustomerFilterSet(ParameterFilterSet):
+	address = django_filters.ModelMultipleChoiceFilter(queryset=Address.objects.all())
+	balance = django_filters.RangeFilter()
+
+	class Meta:
+		model = Customer
+		fields = ['address', 'is_open', 'balance', 'last_name']
@@ -0,0 +1,31 @@
+from django.db import models
+
+class Address(models.Model):
+	line_1 = models.CharField(max_length=100)
+	line_2 = models.CharField(max_length=100, blank=True)
+	city = models.CharField(max_length=50, db_index=True)
+	zip = models.CharField(max_length=10)
+	phone_primary = models.CharField(max_length=20)
+
+	def __unicode__(self):
+		return u'%s, %s' % (self.line_1, self.city)
+
+class Customer(models.Model):
+	first_name = models.CharField(max_length=50)
+	last_name = models.CharField(max_length=50, db_index=True)
+	file = models.CharField(max_length=20)
+	date_added = models.DateTimeField(db_index=True)
+	is_open = models.BooleanField(default=True)
+	balance = models.DecimalField(max_digits=10, decimal_places=2)
+	address = models.ForeignKey(Address)
+
+	def __unicode__(self):
+		return u'%s %s' % (self.first_name, self.last_name)
+
+class Contact(models.Model):
+	customer = models.ForeignKey(Customer)
+	date = models.DateTimeField()
+	note = models.CharField(max_length=200)
+
+	def __unicode__(self):
+		return u'%s on %s' % (self.customer_id, self.date)
@@ -0,0 +1,350 @@
+"""
+Benchmarks the DisplaySet hot paths against a SQLite database of generated
+customers, recording the queries, wall time and peak memory of each
+scenario as JSON:
+
+	python benchmarks/run.py --rows 100000 --output after.json --baseline before.json
+
+The csv_stream_parallel_<n> scenarios format the export on n worker
+processes however many CPUs there are, to see how it scales; the
+csv_export_parallel action uses no more processes than CPUs.
+
+The scenarios ending in _per_cell build their rows the way the column plan
+replaced, inspecting every field again for every cell, as the reference
+the plan is measured against.
+
+The database for each row count is generated once and reused. Each scenario
+runs in a process of its own, so its peak memory isn't hidden by the
+scenarios before it. The threaded
+scenarios serve --threads concurrent clients, as a threaded WSGI server
+would, with and without concurrent_count. With --baseline, scenarios that got slower than --tolerance allows or run more
+queries than before are listed and the exit status is 1.
+"""
+import gc
+import optparse
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+	from StringIO import StringIO
+except ImportError:
+	from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+SIZES = (10000, 100000, 1000000)
+
+class Memory(object):
+	"""
+	The growth of the process's peak RSS while it's entered. The peak never
+	comes down, so this only means something in a fresh process.
+	"""
+	def __enter__(self):
+		gc.collect()
+		self.start = self.rss()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.peak = self.rss() - self.start
+		return False
+
+	def rss(self):
+		import resource
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def make_request(query_string='', user=None):
+	from django.core.handlers.wsgi import WSGIRequest
+	request = WSGIRequest({
+		'REQUEST_METHOD': 'GET',
+		'PATH_INFO': '/customers/',
+		'QUERY_STRING': query_string,
+		'SERVER_NAME': 'testserver',
+		'SERVER_PORT': '80',
+		'wsgi.input': StringIO(),
+		'wsgi.url_scheme': 'http',
+	})
+	request.user = user
+	request.session = {}
+	return request
+
+def consume(response):
+	"Reads all of response, the way a client would."
+	return sum([len(chunk) for chunk in response])
+
+html_re = re.compile("<.*>(.*)</.*>")
+
+def per_cell_csv_stream(modeladmin, queryset):
+	"""
+	csv_stream as it was before column plans: every cell checks its field
+	again. The objects are loaded through the plan all the same, so only
+	building the rows differs.
+	"""
+	import csv
+	from django_displayset.columns import get_column_plan
+	from django_displayset.exporters import EchoBuffer, csv_row
+	chunk_size = getattr(modeladmin, 'export_chunk_size', None) or 500
+	writer = csv.writer(EchoBuffer())
+	fields = []
+	header = []
+	for f in modeladmin.list_display:
+		if f != 'action_checkbox':
+			if callable(f):
+				fields.append(f)
+				try:
+					header.append(f.short_description)
+				except AttributeError:
+					header.append(f.__name__)
+				continue
+			fields.append(f);header.append(f)
+	yield writer.writerow(csv_row(header))
+
+	lines = []
+	for obj in get_column_plan(modeladmin).query_plan.iterate(queryset, chunk_size):
+		row = []
+		for f in fields:
+			if callable(f):
+				text = f(obj)
+				try:
+					text = html_re.search(text).groups()[0]
+					row.append(text)
+				except (TypeError,AttributeError):
+					row.append(text)
+				continue
+			try:
+				attr = getattr(obj, f)
+			except AttributeError:
+				attr = "(None)"
+			row.append(attr)
+		lines.append(writer.writerow(csv_row(row)))
+		if len(lines) >= chunk_size:
+			yield ''.join(lines)
+			lines = []
+	if lines:
+		yield ''.join(lines)
+
+def scenarios(user, rows, threads=8):
+	from django.db import connection
+	from django_displayset import views as displayset_views
+	from django.contrib.admin.templatetags import admin_list
+	from django_displayset.exporters import csv_export, csv_stream
+	from django_displayset.parallel import parallel_csv_stream
+	from django_displayset.templatetags import displayset_list
+	from benchmarks.displays import (CustomerDisplaySet, ConcurrentCustomerDisplaySet, PlainCustomerDisplaySet,
+		CustomerFilterSet)
+	from benchmarks.models import Customer
+
+	def page(query_string, display_class=CustomerDisplaySet):
+		def run():
+			request = make_request(query_string, user)
+			return consume(displayset_views.generic(request, Customer.objects.all(), display_class))
+		return run
+
+	def export(display_class, stream=None, **options):
+		def run():
+			request = make_request('', user)
+			display = display_class(Customer.objects.all(), displayset_views.DefaultDisplaySite)
+			for name, value in options.items():
+				setattr(display, name, value)
+			if stream is not None:
+				return consume(stream(display, Customer.objects.all()))
+			return consume(csv_export(display, request, Customer.objects.all()))
+		return run
+
+	def parallel(processes):
+		def stream(display, queryset):
+			return parallel_csv_stream(display, queryset, processes)
+		return stream
+
+	def render_rows(results):
+		"The table rows of a 1000 row page, built by results(cl)."
+		def run():
+			request = make_request('', user)
+			display = CustomerDisplaySet(Customer.objects.all(), displayset_views.DefaultDisplaySite)
+			list_display = [f for f in display.list_display if f != 'action_checkbox']
+			ChangeList = display.get_changelist(request)
+			cl = ChangeList(request, display.model, list_display, display.list_display_links, display.list_filter,
+				display.date_hierarchy, display.search_fields, display.list_select_related, 1000,
+				display.list_editable, display)
+			cl.formset = None
+			return sum([len(u''.join(row)) for row in results(cl)])
+		return run
+
+	def threaded(query_strings, display_class):
+		"Serves query_strings on each of threads threads at once."
+		def run():
+			sizes = []
+			def client():
+				try:
+					for query_string in query_strings:
+						sizes.append(page(query_string, display_class)())
+				finally:
+					connection.close()
+			workers = [threading.Thread(target=client) for i in range(threads)]
+			for worker in workers:
+				worker.start()
+			for worker in workers:
+				worker.join()
+			return sum(sizes)
+		return run
+
+	def report_header():
+		addresses = '&'.join(['address=%d' % pk for pk in range(1, min(rows, 50) + 1)])
+		query_string = 'submit=1&is_open=2&balance_0=100&balance_1=5000&last_name=Smith&%s' % addresses
+		request = make_request(query_string, user)
+		filter = CustomerFilterSet(request.GET, queryset=Customer.objects.all())
+		return consume(displayset_views.filterset_generic(request, filter, CustomerDisplaySet))
+
+	deep_page = max(rows // CustomerDisplaySet.list_per_page - 1, 0)
+	return [
+		('first_page', page('')),
+		('first_page_concurrent_count', page('', ConcurrentCustomerDisplaySet)),
+		('deep_page', page('p=%d' % deep_page)),
+		('search_relations', page('q=smith+boston')),
+		('sort', page('o=2&ot=desc')),
+		('show_all', page('all=')),
+		('csv_export', export(CustomerDisplaySet)),
+		('csv_stream', export(CustomerDisplaySet, csv_stream)),
+		('csv_stream_per_cell', export(CustomerDisplaySet, per_cell_csv_stream)),
+		('csv_export_fast_rows', export(PlainCustomerDisplaySet)),
+		('csv_export_objects', export(PlainCustomerDisplaySet, fast_rows=False)),
+		('csv_export_parallel', export(PlainCustomerDisplaySet, export_processes=4)),
+		('csv_stream_parallel_1', export(PlainCustomerDisplaySet, parallel(1))),
+		('csv_stream_parallel_2', export(PlainCustomerDisplaySet, parallel(2))),
+		('csv_stream_parallel_4', export(PlainCustomerDisplaySet, parallel(4))),
+		('render_rows', render_rows(displayset_list.results)),
+		('render_rows_per_cell', render_rows(admin_list.results)),
+		('report_header', report_header),
+		('threaded_pages', threaded(['', 'p=1', 'q=smith'], CustomerDisplaySet)),
+		('threaded_pages_concurrent_count', threaded(['', 'p=1', 'q=smith'], ConcurrentCustomerDisplaySet)),
+	]
+
+def measure(func, repeat):
+	"The fastest of repeat runs of func, with the peak memory of them all."
+	from django_displayset.instrumentation import Timings
+	best = None
+	with Memory() as memory:
+		for i in range(repeat):
+			timings = Timings()
+			with timings.phase('run'):
+				size = func()
+			phase = timings.phases[0]
+			result = {
+				'seconds': phase.duration,
+				'queries': phase.queries,
+				'query_seconds': phase.query_time,
+				'bytes': size,
+			}
+			if best is None or result['seconds'] < best['seconds']:
+				best = result
+	best['peak_memory'] = memory.peak
+	return best
+
+def run_scenario(name, options):
+	"Measures the scenario name in a child process and returns its result."
+	args = [sys.executable, os.path.abspath(__file__), '--scenario', name, '--rows', str(options.rows),
+		'--repeat', str(options.repeat), '--threads', str(options.threads),
+		'--database', os.environ['DISPLAYSET_BENCH_DB']]
+	child = subprocess.Popen(args, stdout=subprocess.PIPE)
+	output = child.communicate()[0]
+	if child.returncode:
+		raise SystemExit('Scenario %s failed.' % name)
+	from django.utils import simplejson
+	return simplejson.loads(output.splitlines()[-1])
+
+def compare(results, baseline, tolerance):
+	"Returns a line for each scenario that regressed against baseline."
+	regressions = []
+	for name, result in sorted(results.items()):
+		before = baseline.get(name)
+		if before is None:
+			continue
+		if result['seconds'] > before['seconds'] * (1 + tolerance):
+			regressions.append('%s: %.3fs, was %.3fs' % (name, result['seconds'], before['seconds']))
+		if result['queries'] > before['queries']:
+			regressions.append('%s: %d queries, was %d' % (name, result['queries'], before['queries']))
+	return regressions
+
+def setup(rows, verbosity):
+	from django.core.management import call_command
+	from django.contrib.auth.models import User
+	from benchmarks import data
+
+	call_command('syncdb', interactive=False, verbosity=0)
+	if data.row_count() != rows:
+		if verbosity:
+			print('Generating %d customers...' % rows)
+		data.generate(rows)
+	user, created = User.objects.get_or_create(username='benchmark',
+		defaults={'is_superuser': True, 'is_staff': True})
+	return user
+
+def main(argv=None):
+	parser = optparse.OptionParser(usage='%prog [options]')
+	parser.add_option('--rows', type='int', default=SIZES[0],
+		help='customers to generate, e.g. %s' % ', '.join([str(s) for s in SIZES]))
+	parser.add_option('--repeat', type='int', default=3, help='runs per scenario, the fastest is kept')
+	parser.add_option('--threads', type='int', default=8, help='clients in the threaded scenarios')
+	parser.add_option('--only', action='append', help='run just this scenario, may be repeated')
+	parser.add_option('--output', help='write the results to this JSON file')
+	parser.add_option('--baseline', help='compare against the results in this JSON file')
+	parser.add_option('--tolerance', type='float', default=0.2, help='allowed slowdown against the baseline')
+	parser.add_option('--database', help='SQLite file to use, by default one per row count in the temp directory')
+	parser.add_option('-q', '--quiet', action='store_true')
+	parser.add_option('--scenario', help=optparse.SUPPRESS_HELP) # set in the child processes
+	options, args = parser.parse_args(argv)
+
+	os.environ['DISPLAYSET_BENCH_DB'] = options.database or os.path.join(tempfile.gettempdir(),
+		'displayset_bench_%d.sqlite3' % options.rows)
+	from django.utils import simplejson
+
+	if options.scenario:
+		user = setup(options.rows, 0)
+		func = dict(scenarios(user, options.rows, options.threads))[options.scenario]
+		print(simplejson.dumps(measure(func, options.repeat)))
+		return 0
+
+	verbosity = not options.quiet
+	user = setup(options.rows, verbosity)
+
+	results = {}
+	for name, func in scenarios(user, options.rows, options.threads):
+		if options.only and name not in options.only:
+			continue
+		results[name] = run_scenario(name, options)
+		if verbosity:
+			print('%-32s %8.3fs %6d queries %10d KB peak' % (name, results[name]['seconds'],
+				results[name]['queries'], results[name]['peak_memory'] // 1024))
+
+	report = {
+		'rows': options.rows,
+		'python': platform.python_version(),
+		'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'results': results,
+	}
+	if options.output:
+		output = open(options.output, 'w')
+		try:
+			simplejson.dump(report, output, indent=2, sort_keys=True)
+		finally:
+			output.close()
+
+	if options.baseline:
+		baseline = simplejson.load(open(options.baseline))
+		if baseline.get('rows') != options.rows:
+			print('Baseline was run with %s rows, not %d.' % (baseline.get('rows'), options.rows))
+		regressions = compare(results, baseline['results'], options.tolerance)
+		for line in regressions:
+			print('REGRESSION %s' % line)
+		if regressions:
+			return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,41 @@
+# Settings for the DisplaySet benchmarks, see benchmarks/run.py.
+import os
+import tempfile
+
+DEBUG = False
+TEMPLATE_DEBUG = False
+
+DATABASES = {
+	'default': {
+		'ENGINE': 'django.db.backends.sqlite3',
+		'NAME': os.environ.get('DISPLAYSET_BENCH_DB') or os.path.join(tempfile.gettempdir(), 'displayset_bench.sqlite3'),
+	}
+}
+
+CACHE_BACKEND = 'locmem://'
+
+SECRET_KEY = 'displayset-benchmarks'
+SITE_ID = 1
+ROOT_URLCONF = 'benchmarks.urls'
+
+TEMPLATE_LOADERS = (
+	'django.template.loaders.filesystem.Loader',
+	'django.template.loaders.app_directories.Loader',
+)
+
+TEMPLATE_CONTEXT_PROCESSORS = (
+	'django.contrib.auth.context_processors.auth',
+	'django.core.context_processors.request',
+	'django.core.context_processors.csrf',
+	'django.contrib.messages.context_processors.messages',
+)
+
+INSTALLED_APPS = (
+	'django.contrib.auth',
+	'django.contrib.contenttypes',
+	'django.contrib.sessions',
+	'django.contrib.messages',
+	'django.contrib.admin',
+	'django_displayset',
+	'benchmarks',
+)
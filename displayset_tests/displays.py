@@ -0,0 +1,72 @@
+import django_filters
+from django.db.models import Count, Sum
+
+from django_displayset import views as displayset_views
+from django_displayset.filterset import ParameterFilterSet
+
+from displayset_tests.models import Address, Customer
+
+def city(obj):
+	return obj.address.city
+city.select_related = ('address',)
+city.admin_order_field = 'address__city'
+
+def contacts(obj):
+	return obj.contact_count
+contacts.annotations = {'contact_count': Count('contact')}
+contacts.admin_order_field = 'contact_count'
+
+class CustomerDisplaySet(displayset_views.DisplaySet):
+	list_display = ('first_name', 'last_name', city, 'balance')
+	search_fields = ('first_name', 'last_name', 'address__city', 'contact__note')
+	list_per_page = 10
+
+class RedirectDisplaySet(CustomerDisplaySet):
+	auto_redirect = True
+
+class KeysetDisplaySet(CustomerDisplaySet):
+	list_display = ('first_name', 'added', 'closed')
+	pagination = 'keyset'
+	list_per_page = 2
+
+class ContactsDisplaySet(CustomerDisplaySet):
+	list_display = ('last_name', contacts)
+
+class PageCacheDisplaySet(CustomerDisplaySet):
+	page_cache = True
+
+class ExportDisplaySet(CustomerDisplaySet):
+	export = True
+	action_batch_size = 2
+
+class EditableDisplaySet(CustomerDisplaySet):
+	list_display = ('first_name', 'last_name', 'balance')
+	list_editable = ('balance',)
+
+def mark_open(modeladmin, request, queryset):
+	queryset.update(is_open=True)
+
+class SharedDisplaySet(CustomerDisplaySet):
+	"Uses every class attribute that requests used to modify in place."
+	list_display = ('first_name', city, 'balance')
+	default_list_display = ['last_name']
+	use_get_absolute_url = ['first_name']
+	actions = [mark_open]
+	export = True
+
+class InstrumentedDisplaySet(CustomerDisplaySet):
+	instrument = True
+
+class TotalsDisplaySet(CustomerDisplaySet):
+	list_aggregates = {'balance': Sum}
+	search_distinct_fields = ('contact__note',)
+
+class CustomerFilterSet(ParameterFilterSet):
+	address = django_filters.ModelMultipleChoiceFilter(queryset=Address.objects.all())
+
+	class Meta:
+		model = Customer
+		fields = ['address', 'is_open']
+
+def customers(request, display_class=CustomerDisplaySet):
+	return displayset_views.generic(request, Customer.objects.all(), display_class)
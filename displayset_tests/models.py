@@ -0,0 +1,29 @@
+from django.db import models
+
+class Address(models.Model):
+	city = models.CharField(max_length=50)
+
+	def __unicode__(self):
+		return self.city
+
+class Customer(models.Model):
+	first_name = models.CharField(max_length=50)
+	last_name = models.CharField(max_length=50)
+	balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+	is_open = models.BooleanField(default=True)
+	added = models.DateTimeField()
+	closed = models.DateTimeField(null=True, blank=True)
+	address = models.ForeignKey(Address)
+
+	def __unicode__(self):
+		return u'%s %s' % (self.first_name, self.last_name)
+
+	def get_absolute_url(self):
+		return '/customers/%d/' % self.pk
+
+class Contact(models.Model):
+	customer = models.ForeignKey(Customer)
+	note = models.CharField(max_length=200)
+
+	def __unicode__(self):
+		return self.note
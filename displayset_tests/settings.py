@@ -0,0 +1,55 @@
+# Settings for the django_displayset tests, see runtests.py.
+import os
+import tempfile
+
+DEBUG = False
+TEMPLATE_DEBUG = False
+
+DATABASES = {
+	'default': {
+		'ENGINE': 'django.db.backends.sqlite3',
+		'NAME': os.path.join(tempfile.gettempdir(), 'displayset_tests.sqlite3'),
+		# a file rather than :memory: so threads share the test database
+		'TEST_NAME': os.path.join(tempfile.gettempdir(), 'displayset_tests_test.sqlite3'),
+	}
+}
+
+CACHE_BACKEND = 'locmem://'
+
+# where background exports are written
+MEDIA_ROOT = os.path.join(tempfile.gettempdir(), 'displayset_tests_media')
+MEDIA_URL = '/media/'
+
+SECRET_KEY = 'displayset-tests'
+SITE_ID = 1
+ROOT_URLCONF = 'displayset_tests.urls'
+
+TEMPLATE_LOADERS = (
+	'django.template.loaders.filesystem.Loader',
+	'django.template.loaders.app_directories.Loader',
+)
+
+TEMPLATE_CONTEXT_PROCESSORS = (
+	'django.contrib.auth.context_processors.auth',
+	'django.core.context_processors.request',
+	'django.core.context_processors.csrf',
+	'django.contrib.messages.context_processors.messages',
+)
+
+MIDDLEWARE_CLASSES = (
+	'django.middleware.common.CommonMiddleware',
+	'django.contrib.sessions.middleware.SessionMiddleware',
+	'django.middleware.csrf.CsrfViewMiddleware',
+	'django.contrib.auth.middleware.AuthenticationMiddleware',
+	'django.contrib.messages.middleware.MessageMiddleware',
+)
+
+INSTALLED_APPS = (
+	'django.contrib.auth',
+	'django.contrib.contenttypes',
+	'django.contrib.sessions',
+	'django.contrib.messages',
+	'django.contrib.admin',
+	'django_displayset',
+	'displayset_tests',
+)
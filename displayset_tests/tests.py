@@ -0,0 +1,742 @@
+import datetime
+import re
+import threading
+import time
+import types
+
+try:
+	from StringIO import StringIO
+except ImportError:
+	from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.admin.models import LogEntry
+from django.contrib.admin.templatetags.admin_list import result_list
+from django.contrib.messages.storage import default_storage
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, connections
+from django.db.models import Max, Sum, signals
+from django.http import Http404
+from django.test import TestCase, TransactionTestCase
+from django.utils import simplejson
+from django.utils.http import urlencode
+
+import django_filters
+
+from django_displayset import jobs, pagecache
+from django_displayset.aggregates import get_aggregates
+from django_displayset.counts import CachedCount, CountPool, EstimatedCount
+from django_displayset.exporters import arrow_type, arrow_value, csv_stream
+from django_displayset.filterset import LabelCache
+from django_displayset.instrumentation import Timings
+from django_displayset.models import ExportJob
+from django_displayset.parallel import parallel_csv_stream
+from django_displayset.search import SQLiteFTSSearch
+from django_displayset.templatetags.displayset_list import displayset_result_list
+from django_displayset.views import DefaultDisplaySite, KEYSET_VAR, build_report_header, encode_cursor, generic, json_generic
+
+from displayset_tests.displays import contacts, ContactsDisplaySet, CustomerDisplaySet, CustomerFilterSet, EditableDisplaySet, ExportDisplaySet, InstrumentedDisplaySet, SharedDisplaySet, TotalsDisplaySet, PageCacheDisplaySet, RedirectDisplaySet, KeysetDisplaySet, customers
+from displayset_tests.models import Address, Customer, Contact
+
+def make_request(query_string='', user=None, method='GET', data=None):
+	body = data and urlencode(data) or ''
+	request = WSGIRequest({
+		'REQUEST_METHOD': method,
+		'PATH_INFO': '/customers/',
+		'QUERY_STRING': query_string,
+		'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+		'CONTENT_LENGTH': str(len(body)),
+		'SERVER_NAME': 'testserver',
+		'SERVER_PORT': '80',
+		'wsgi.input': StringIO(body),
+		'wsgi.url_scheme': 'http',
+	})
+	request.user = user
+	request._dont_enforce_csrf_checks = True
+	request.session = {}
+	request._messages = default_storage(request)
+	return request
+
+class CaptureQueries(object):
+	"Records the queries run while it's entered, whatever DEBUG is."
+	def __enter__(self):
+		self.debug = settings.DEBUG
+		settings.DEBUG = True
+		self.start = len(connection.queries)
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.queries = connection.queries[self.start:]
+		settings.DEBUG = self.debug
+		return False
+
+class DisplaySetMixin(object):
+	def setUp(self):
+		self.user = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+		boston = Address.objects.create(city='Boston')
+		denver = Address.objects.create(city='Denver')
+		added = datetime.datetime(2010, 1, 1)
+		self.smith = Customer.objects.create(first_name='Ann', last_name='Smith', balance='10.00', added=added, address=boston)
+		self.jones = Customer.objects.create(first_name='Bob', last_name='Jones', balance='20.00', added=added, address=denver)
+		self.brown = Customer.objects.create(first_name='Cy', last_name='Brown', balance='30.00', added=added, address=denver)
+		Contact.objects.create(customer=self.smith, note='called about billing')
+
+	def assertNumQueries(self, num, func, *args, **kwargs):
+		"Like later Django's: func(*args, **kwargs) has to run exactly num queries."
+		with CaptureQueries() as captured:
+			result = func(*args, **kwargs)
+			if hasattr(result, 'content'):
+				result.content # streamed responses query as they're read
+		self.assertEqual(len(captured.queries), num, '%d queries run, %d expected:\n%s' % (
+			len(captured.queries), num, '\n'.join([q['sql'] for q in captured.queries])))
+		return result
+
+	def get(self, query_string='', display_class=CustomerDisplaySet):
+		return customers(make_request(query_string, self.user), display_class)
+
+	def changelist(self, query_string='', display_class=CustomerDisplaySet, queryset=None):
+		"The DisplayList changelist_view would build for query_string."
+		if queryset is None:
+			queryset = Customer.objects.all()
+		display = display_class(queryset, DefaultDisplaySite)
+		request = make_request(query_string, self.user)
+		list_display = list(display.list_display)
+		if not display.get_actions(request):
+			list_display = [f for f in list_display if f != 'action_checkbox']
+		ChangeList = display.get_changelist(request)
+		return ChangeList(request, display.model, list_display, display.list_display_links, display.list_filter,
+			display.date_hierarchy, display.search_fields, display.list_select_related, display.list_per_page,
+			display.list_editable, display)
+
+class DisplaySetTestCase(DisplaySetMixin, TestCase):
+	pass
+
+class AutoRedirectTests(DisplaySetTestCase):
+	def test_redirects_to_single_result(self):
+		response = self.get('q=Smith', RedirectDisplaySet)
+		self.assertEqual(response.status_code, 302)
+		self.assertEqual(response['Location'], self.smith.get_absolute_url())
+
+	def test_shows_several_results(self):
+		response = self.get('q=Denver', RedirectDisplaySet)
+		self.assertEqual(response.status_code, 200)
+
+	def test_redirect_runs_only_count_and_page(self):
+		self.assertNumQueries(2, self.get, 'q=Smith', RedirectDisplaySet)
+
+	def test_no_extra_queries_when_not_redirecting(self):
+		with CaptureQueries() as plain:
+			self.get('q=Denver', CustomerDisplaySet)
+		self.assertNumQueries(len(plain.queries), self.get, 'q=Denver', RedirectDisplaySet)
+
+	def test_single_result_without_auto_redirect(self):
+		# the count, the page and the template's lookup of the user's messages
+		response = self.assertNumQueries(3, self.get, 'q=Smith', CustomerDisplaySet)
+		self.assertEqual(response.status_code, 200)
+
+class KeysetTests(DisplaySetTestCase):
+	def walk(self, query_string):
+		"The pks of every keyset page, following the Next links."
+		seen = []
+		while query_string is not None and len(seen) < 100:
+			cl = self.changelist(query_string, KeysetDisplaySet)
+			seen.extend([obj.pk for obj in cl.result_list])
+			query_string = cl.keyset_next and cl.keyset_next[1:]
+		return seen
+
+	def test_sub_second_datetimes(self):
+		Customer.objects.all().delete()
+		start = datetime.datetime(2010, 1, 1, 12, 0, 0)
+		address = Address.objects.create(city='Omaha')
+		for i in range(25):
+			# several rows per second, so pages end mid-second
+			Customer.objects.create(first_name='C%02d' % i, last_name='X', added=start + datetime.timedelta(microseconds=i * 250000),
+				address=address)
+		expected = list(Customer.objects.order_by('added').values_list('pk', flat=True))
+		self.assertEqual(self.walk('o=1&ot=asc'), expected)
+		self.assertEqual(self.walk('o=1&ot=desc'), list(reversed(expected)))
+
+	def test_nullable_sort_pages_by_offset(self):
+		self.jones.closed = datetime.datetime(2011, 1, 1)
+		self.jones.save()
+		cl = self.changelist('o=2&ot=asc', KeysetDisplaySet)
+		self.assertFalse(cl.keyset)
+		self.assertEqual(cl.result_count, 3)
+		self.assertEqual(len(cl.result_list), 2)
+		self.assertEqual(self.get('o=2&ot=desc', KeysetDisplaySet).status_code, 200)
+
+	def test_bad_cursor_starts_over(self):
+		first = [obj.pk for obj in self.changelist('o=1&ot=asc', KeysetDisplaySet).result_list]
+		for cursor in (['added', 'asc', 'next', 'notadate', 1], ['added', 'asc', 'next', None, 1],
+				['added', 'asc', 'next', '2010-01-01 00:00:00', 'x'], ['added', 'asc', 'next', 5, {}]):
+			query_string = 'o=1&ot=asc&%s=%s' % (KEYSET_VAR, encode_cursor(cursor))
+			cl = self.changelist(query_string, KeysetDisplaySet)
+			self.assertEqual([obj.pk for obj in cl.result_list], first)
+			self.assertEqual(self.get(query_string, KeysetDisplaySet).status_code, 200)
+
+	def test_search_form_starts_over(self):
+		cl = self.changelist('o=1&ot=asc', KeysetDisplaySet)
+		next = cl.keyset_next
+		cl = self.changelist(next[1:], KeysetDisplaySet)
+		self.assertFalse(KEYSET_VAR in cl.params)
+		self.assertFalse(KEYSET_VAR + '=' in cl.get_query_string({'q': 'Smith'}))
+
+class AnnotationTests(DisplaySetTestCase):
+	def test_sort_on_annotated_column(self):
+		Contact.objects.create(customer=self.jones, note='one')
+		Contact.objects.create(customer=self.jones, note='two')
+		order = self.changelist('', ContactsDisplaySet).list_display.index(contacts)
+		cl = self.changelist('o=%d&ot=desc' % order, ContactsDisplaySet)
+		self.assertEqual([(obj.last_name, obj.contact_count) for obj in cl.result_list],
+			[('Jones', 2), ('Smith', 1), ('Brown', 0)])
+		self.assertEqual(cl.result_count, 3)
+		# actions and exports work from the ordered query_set itself
+		self.assertEqual([obj.last_name for obj in cl.query_set], ['Jones', 'Smith', 'Brown'])
+
+	def test_sorted_page_renders(self):
+		order = self.changelist('', ContactsDisplaySet).list_display.index(contacts)
+		self.assertEqual(self.get('o=%d' % order, ContactsDisplaySet).status_code, 200)
+
+class EstimatedDisplaySet(CustomerDisplaySet):
+	count_strategy = 'estimated'
+
+class CountTests(DisplaySetTestCase):
+	def test_cached_count_of_empty_queryset(self):
+		self.assertEqual(CachedCount()(Customer.objects.filter(pk__in=[])), 0)
+
+	def test_estimated_count_of_empty_queryset(self):
+		self.assertEqual(EstimatedCount()(Customer.objects.filter(pk__in=[])), 0)
+
+	def test_estimate_without_planner_is_not_cheap(self):
+		# SQLite has no estimate, so the total isn't counted a second time
+		cl = self.changelist('q=Denver', EstimatedDisplaySet)
+		self.assertNumQueries(1, lambda: cl.result_count)
+		self.assertEqual(cl.result_count, 2)
+		self.assertEqual(cl.full_result_count, -1)
+
+class InstrumentationTests(DisplaySetTestCase):
+	def test_phase_counts_queries_without_debug(self):
+		self.assertFalse(settings.DEBUG)
+		timings = Timings()
+		with timings.phase('run'):
+			list(Customer.objects.all())
+			Customer.objects.count()
+		self.assertEqual(timings.queries(), 2)
+		self.assertFalse('cursor' in connection.__dict__)
+
+	def test_results_are_timed_apart_from_render(self):
+		response = self.get('q=Denver', InstrumentedDisplaySet)
+		phases = dict([(part.split(';')[0], part) for part in response['Server-Timing'].split(', ')])
+		# the count and the page, then the template's lookup of the user's messages
+		self.assertTrue(phases['results'].endswith('desc="2 queries"'), phases)
+		self.assertTrue(phases['render'].endswith('desc="1 queries"'), phases)
+
+class FullTextSearchTests(DisplaySetMixin, TransactionTestCase):
+	# sqlite3 commits before DDL, so the FTS table can't live in a test transaction
+	def setUp(self):
+		super(FullTextSearchTests,self).setUp()
+		cursor = connection.cursor()
+		cursor.execute('CREATE VIRTUAL TABLE customer_fts USING fts5(first_name, last_name)')
+		for customer in Customer.objects.all():
+			cursor.execute('INSERT INTO customer_fts (rowid, first_name, last_name) VALUES (%s, %s, %s)',
+				[customer.pk, customer.first_name, customer.last_name])
+		self.backend = SQLiteFTSSearch('customer_fts')
+
+	def tearDown(self):
+		connection.cursor().execute('DROP TABLE customer_fts')
+
+	def search(self, search_fields, query):
+		return sorted(self.backend.search(Customer.objects.all(), search_fields, query).values_list('pk', flat=True))
+
+	def test_words_across_indexed_and_related_fields(self):
+		fields = ('first_name', 'last_name', 'address__city', 'contact__note')
+		self.assertEqual(self.search(fields, 'smith boston'), [self.smith.pk])
+		self.assertEqual(self.search(fields, 'denver jones'), [self.jones.pk])
+		self.assertEqual(self.search(fields, 'smith denver'), [])
+
+	def test_prefix_only_on_marked_fields(self):
+		fields = ('^first_name', 'last_name')
+		self.assertEqual(self.search(fields, 'an'), [self.smith.pk])
+		self.assertEqual(self.search(fields, 'smi'), [])
+		self.assertEqual(self.search(fields, 'smith'), [self.smith.pk])
+
+class PageCacheTests(DisplaySetTestCase):
+	def setUp(self):
+		super(PageCacheTests,self).setUp()
+		pagecache.invalidate(Customer)
+
+	def test_serves_stored_page(self):
+		first = generic(make_request('', self.user), Customer.objects.all(), PageCacheDisplaySet)
+		self.assertEqual(first.status_code, 200)
+		second = self.assertNumQueries(0, generic, make_request('', self.user), Customer.objects.all(), PageCacheDisplaySet)
+		self.assertEqual(second.content, first.content)
+
+	def test_each_user_gets_their_csrf_token(self):
+		request = make_request('', self.user)
+		request.META['CSRF_COOKIE'] = 'a' * 32
+		first = generic(request, Customer.objects.all(), PageCacheDisplaySet)
+		self.assertTrue('a' * 32 in first.content)
+		request = make_request('', self.user)
+		request.META['CSRF_COOKIE'] = 'b' * 32
+		second = self.assertNumQueries(0, generic, request, Customer.objects.all(), PageCacheDisplaySet)
+		self.assertTrue('b' * 32 in second.content)
+		self.assertFalse('a' * 32 in second.content)
+
+	def test_users_with_same_permissions_get_their_own_pages(self):
+		other = User.objects.create(username='other', is_staff=True, is_superuser=True)
+		display = PageCacheDisplaySet(Customer.objects.all(), DefaultDisplaySite)
+		self.assertNotEqual(pagecache.page_key(display, make_request('', self.user)),
+			pagecache.page_key(display, make_request('', other)))
+
+	def test_empty_queryset_is_not_cached(self):
+		display = PageCacheDisplaySet(Customer.objects.filter(pk__in=[]), DefaultDisplaySite)
+		self.assertEqual(pagecache.page_key(display, make_request('', self.user)), None)
+		response = generic(make_request('', self.user), Customer.objects.filter(pk__in=[]), PageCacheDisplaySet)
+		self.assertEqual(response.status_code, 200)
+
+class ExportJobTests(DisplaySetTestCase):
+	def setUp(self):
+		super(ExportJobTests,self).setUp()
+		self.owner = User.objects.create(username='owner', is_staff=True)
+		self.other = User.objects.create(username='other', is_staff=True)
+
+	def status(self, runner, job_id, user):
+		request = make_request('json=1', user)
+		return jobs.export_status(request, job_id, runner)
+
+	def test_only_owner_or_superuser_sees_thread_job(self):
+		runner = jobs.ThreadExportRunner()
+		job_id = 'a' * 32
+		runner.report(job_id, status='running', user=self.owner.pk)
+		self.assertEqual(self.status(runner, job_id, self.owner).status_code, 200)
+		self.assertEqual(self.status(runner, job_id, self.user).status_code, 200)
+		self.assertRaises(Http404, self.status, runner, job_id, self.other)
+		self.assertRaises(Http404, self.status, runner, job_id, AnonymousUser())
+
+	def test_database_jobs_are_known_by_token(self):
+		display = CustomerDisplaySet(Customer.objects.all(), DefaultDisplaySite)
+		token = jobs.database_runner.submit(jobs.serialize_export(display, Customer.objects.all()), self.owner)
+		job = ExportJob.objects.get(token=token)
+		self.assertEqual(len(token), 32)
+		self.assertEqual(job.user, self.owner)
+		self.assertRaises(Http404, self.status, 'database', str(job.pk), self.owner)
+		self.assertRaises(Http404, self.status, 'database', token, self.other)
+
+		self.assertEqual(jobs.database_runner.run_pending(), 1)
+		job = ExportJob.objects.get(pk=job.pk)
+		self.assertEqual(job.status, 'done', job.error)
+		self.assertFalse(token in job.file)
+		self.assertFalse('/%d/' % job.pk in job.file)
+		self.assertEqual(self.status('database', token, self.owner).status_code, 200)
+		self.assertTrue('Smith' in open(jobs.default_storage.path(job.file)).read())
+		jobs.default_storage.delete(job.file)
+
+class FakeArrow(object):
+	"Stands in for pyarrow, naming the types it's asked for."
+	def __getattr__(self, name):
+		return lambda *args: (name,) + args
+
+class ParquetTypeTests(DisplaySetTestCase):
+	def test_types_come_from_fields(self):
+		opts = Customer._meta
+		arrow = FakeArrow()
+		self.assertEqual(arrow_type(arrow, opts.get_field('first_name')), ('string',))
+		self.assertEqual(arrow_type(arrow, opts.get_field('balance')), ('decimal128', 10, 2))
+		self.assertEqual(arrow_type(arrow, opts.get_field('is_open')), ('bool_',))
+		self.assertEqual(arrow_type(arrow, opts.get_field('added')), ('timestamp', 'us'))
+		self.assertEqual(arrow_type(arrow, opts.get_field('id')), ('int64',))
+		self.assertEqual(arrow_type(arrow, None), ('string',))
+
+	def test_values(self):
+		self.assertEqual(arrow_value('(None)', True), None)
+		self.assertEqual(arrow_value(3, True), 3)
+		self.assertEqual(arrow_value(3, False), u'3')
+		self.assertEqual(arrow_value(None, False), None)
+
+class BandFilterSet(CustomerFilterSet):
+	band = django_filters.ChoiceFilter(name='balance', choices=[('10', 'Low'), ('30', 'High')])
+
+class LabelCacheTests(DisplaySetTestCase):
+	def test_choice_labels_are_kept_per_class(self):
+		first = BandFilterSet({}, queryset=Customer.objects.all()).choice_labels('band')
+		self.assertEqual(first, {u'10': u'Low', u'30': u'High'})
+		self.assertTrue(BandFilterSet({}, queryset=Customer.objects.all()).choice_labels('band') is first)
+
+		old = BandFilterSet.base_filters['band'].extra['choices']
+		BandFilterSet.base_filters['band'].extra['choices'] = [('10', 'Some')]
+		try:
+			labels = BandFilterSet({}, queryset=Customer.objects.all()).choice_labels('band')
+		finally:
+			BandFilterSet.base_filters['band'].extra['choices'] = old
+		self.assertEqual(labels, {u'10': u'Some'})
+
+	def test_filterset_watches_its_models(self):
+		class WatchingFilterSet(CustomerFilterSet):
+			label_cache = LabelCache()
+		WatchingFilterSet({}, queryset=Customer.objects.all())
+		self.assertTrue(Address in WatchingFilterSet.label_cache.watched)
+
+	def test_saves_and_evictions_change_the_version(self):
+		labels = LabelCache()
+		address = self.smith.address
+		labels.watch(Address)
+		first = labels.version(Address)
+		self.assertEqual(labels.resolve(Address, [address.pk]), {unicode(address.pk): u'Boston'})
+		time.sleep(0.01)
+		address.city = 'Salem'
+		address.save()
+		second = labels.version(Address)
+		self.assertEqual(labels.resolve(Address, [address.pk]), {unicode(address.pk): u'Salem'})
+		time.sleep(0.01)
+		cache.delete(labels.version_key(Address))
+		self.assertFalse(labels.version(Address) in (first, second))
+
+class TwoAddressFilterSet(CustomerFilterSet):
+	billing = django_filters.ModelMultipleChoiceFilter(name='address', queryset=Address.objects.all())
+	label_cache = LabelCache()
+
+class ReportHeaderTests(DisplaySetTestCase):
+	def header(self, params, filterset_class=CustomerFilterSet):
+		display = CustomerDisplaySet(Customer.objects.all(), DefaultDisplaySite)
+		filter = filterset_class({}, queryset=Customer.objects.all())
+		return build_report_header(display, filter, params)
+
+	def test_range_parts_in_any_order(self):
+		header = self.header([('balance_2', [u'30']), ('first_name', [u'Al']), ('balance_0', [u'10']), ('balance_1', [u'20'])])
+		self.assertEqual(header, [('Balance', u'10 - 20 - 30'), ('First Name', [u'Al'])])
+
+	def test_trailing_parameter_is_kept(self):
+		header = self.header([('added_0', [u'2010-01-01']), ('added_1', [u'2010-12-31']), ('last_name', [u'Smith'])])
+		self.assertEqual(header, [('Added', u'2010-01-01 - 2010-12-31'), ('Last Name', [u'Smith'])])
+
+	def test_single_range_part(self):
+		header = self.header([('added_0', [u'2010-01-01'])])
+		self.assertEqual(header, [('Added 0', [u'2010-01-01'])])
+
+	def test_model_choices_of_one_model_in_one_query(self):
+		cache.clear()
+		denver = self.brown.address
+		params = [('address', [unicode(self.smith.address.pk)]), ('billing', [unicode(denver.pk), u'999'])]
+		with CaptureQueries() as captured:
+			header = self.header(params, TwoAddressFilterSet)
+		self.assertEqual(header, [('Address', u'Boston'), ('Billing', u'Denver')])
+		self.assertEqual(len([q for q in captured.queries if 'displayset_tests_address' in q['sql']]), 1)
+
+class PagedDisplaySet(CustomerDisplaySet):
+	list_per_page = 2
+	last_modified_field = 'added'
+
+class JsonViewTests(DisplaySetTestCase):
+	def json(self, query_string='', display_class=CustomerDisplaySet, **headers):
+		request = make_request(query_string, self.user)
+		request.META.update(headers)
+		return json_generic(request, Customer.objects.all(), display_class)
+
+	def data(self, query_string='', display_class=CustomerDisplaySet):
+		response = self.json(query_string, display_class)
+		self.assertEqual(response.status_code, 200)
+		return simplejson.loads(response.content)
+
+	def test_payload(self):
+		data = self.data('o=1&ot=desc')
+		self.assertEqual(sorted(data.keys()), ['aggregates', 'count', 'full_count', 'header', 'next', 'page', 'pages',
+			'previous', 'rows'])
+		self.assertEqual(data['header'], ['first_name', 'last_name', 'city', 'balance'])
+		self.assertEqual([row[:3] for row in data['rows']], [['Ann', 'Smith', 'Boston'], ['Bob', 'Jones', 'Denver'],
+			['Cy', 'Brown', 'Denver']])
+		self.assertEqual([float(row[3]) for row in data['rows']], [10, 20, 30])
+		self.assertEqual((data['count'], data['page'], data['pages']), (3, 0, 1))
+		self.assertEqual((data['next'], data['previous'], data['aggregates']), (None, None, None))
+
+	def test_offset_links(self):
+		first = self.data('', PagedDisplaySet)
+		self.assertEqual((first['next'], first['previous'], first['pages']), ('?p=1', None, 2))
+		second = self.data(first['next'][1:], PagedDisplaySet)
+		self.assertEqual((second['next'], second['previous']), (None, '?p=0'))
+		self.assertEqual(len(first['rows']) + len(second['rows']), 3)
+
+	def test_keyset_links(self):
+		first = self.data('o=1&ot=asc', KeysetDisplaySet)
+		self.assertEqual(first['previous'], None)
+		self.assertTrue(KEYSET_VAR in first['next'])
+		second = self.data(first['next'][1:], KeysetDisplaySet)
+		self.assertEqual(second['next'], None)
+		self.assertTrue(KEYSET_VAR in second['previous'])
+		names = [row[0] for row in first['rows'] + second['rows']]
+		self.assertEqual(sorted(names), ['Ann', 'Bob', 'Cy'])
+		self.assertEqual([row[0] for row in self.data(second['previous'][1:], KeysetDisplaySet)['rows']],
+			[row[0] for row in first['rows']])
+
+	def test_etag(self):
+		etag = self.json()['ETag']
+		self.assertEqual(self.json(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+		Customer.objects.filter(pk=self.smith.pk).update(last_name='Smythe')
+		self.assertEqual(self.json(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	def test_last_modified(self):
+		self.assertFalse(self.json().has_header('Last-Modified'))
+		modified = self.json('', PagedDisplaySet)['Last-Modified']
+		self.assertEqual(self.json('', PagedDisplaySet, HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+		Customer.objects.filter(pk=self.smith.pk).update(added=datetime.datetime(2011, 1, 1))
+		self.assertEqual(self.json('', PagedDisplaySet, HTTP_IF_MODIFIED_SINCE=modified).status_code, 200)
+
+	def test_if_none_match_wins(self):
+		response = self.json('', PagedDisplaySet)
+		modified, etag = response['Last-Modified'], response['ETag']
+		self.assertEqual(self.json('', PagedDisplaySet, HTTP_IF_NONE_MATCH='"stale"',
+			HTTP_IF_MODIFIED_SINCE=modified).status_code, 200)
+		self.assertEqual(self.json('', PagedDisplaySet, HTTP_IF_NONE_MATCH=etag,
+			HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 1970 00:00:00 GMT').status_code, 304)
+
+class ExportActionTests(DisplaySetTestCase):
+	def export(self, selected, queryset=None):
+		if queryset is None:
+			queryset = Customer.objects.order_by('last_name')
+		display = ExportDisplaySet(Customer.objects.all(), DefaultDisplaySite)
+		request = make_request('', self.user, 'POST')
+		func = display.get_actions(request)['csv_export'][0]
+		with CaptureQueries() as captured:
+			content = ''.join(display.run_action(func, request, queryset, selected))
+		return content.splitlines(), captured.queries
+
+	def test_selection_is_exported_in_batches(self):
+		selected = [str(c.pk) for c in (self.smith, self.jones, self.brown)]
+		lines, queries = self.export(selected)
+		self.assertEqual([line.split(',')[1] for line in lines[1:]], ['Brown', 'Jones', 'Smith'])
+		for query in queries:
+			for values in re.findall(r' IN \(([^)]*)\)', query['sql']):
+				self.assertTrue(len(values.split(',')) <= ExportDisplaySet.action_batch_size, query['sql'])
+			# the selection is never found by scanning the whole report
+			self.assertTrue(' IN (' in query['sql'], query['sql'])
+
+	def test_batches_follow_mixed_ordering(self):
+		Customer.objects.filter(pk=self.jones.pk).update(added=datetime.datetime(2011, 1, 1))
+		selected = [str(c.pk) for c in (self.smith, self.brown, self.jones)]
+		lines, queries = self.export(selected, Customer.objects.order_by('-added', 'last_name'))
+		self.assertEqual([line.split(',')[1] for line in lines[1:]], ['Jones', 'Brown', 'Smith'])
+
+	def test_non_ascii_cells(self):
+		self.smith.last_name = u'Sm\xeft\u0127'
+		self.smith.save()
+		lines, queries = self.export(None)
+		self.assertTrue(u'Sm\xeft\u0127'.encode('utf-8') in lines[3])
+		self.assertEqual(len(lines), 4)
+
+	def test_small_selection(self):
+		lines, queries = self.export([str(self.jones.pk)])
+		self.assertEqual([line.split(',')[1] for line in lines[1:]], ['Jones'])
+
+class RunActionTests(DisplaySetTestCase):
+	def run_action(self, func, selected):
+		display = ExportDisplaySet(Customer.objects.all(), DefaultDisplaySite)
+		queryset = Customer.objects.filter(contact__isnull=True).order_by('last_name').distinct()
+		with CaptureQueries() as captured:
+			display.run_action(func, make_request('', self.user, 'POST'), queryset, selected)
+		return captured.queries
+
+	def test_set_based(self):
+		seen = []
+		def action(modeladmin, request, queryset):
+			seen.append((queryset.query.order_by, queryset.query.distinct, sorted(queryset.values_list('pk', flat=True))))
+		action.set_based = True
+		selected = [str(c.pk) for c in (self.smith, self.jones, self.brown)]
+		self.run_action(action, selected)
+		self.assertEqual(seen, [([], False, [self.jones.pk]), ([], False, [self.brown.pk])])
+		del seen[:]
+		self.run_action(action, None)
+		self.assertEqual(seen, [([], False, [self.jones.pk, self.brown.pk])])
+
+	def test_row_based(self):
+		seen = []
+		def action(modeladmin, request, objects):
+			seen.append(isinstance(objects, types.GeneratorType))
+			seen.extend([obj.last_name for obj in objects])
+		action.row_based = True
+		selected = [str(c.pk) for c in (self.smith, self.jones, self.brown)]
+		queries = self.run_action(action, selected)
+		self.assertEqual(seen, [True, 'Jones', 'Brown'])
+		self.assertEqual(len(queries), 2)
+		for query in queries:
+			self.assertTrue(' IN (' in query['sql'], query['sql'])
+
+class EditedDisplaySet(EditableDisplaySet):
+	list_editable_bulk = True
+
+class BulkEditTests(DisplaySetTestCase):
+	def post(self, balances, display_class=EditableDisplaySet):
+		data = {'_save': 'Save', 'form-TOTAL_FORMS': str(len(balances)),
+			'form-INITIAL_FORMS': str(len(balances)), 'form-MAX_NUM_FORMS': ''}
+		for i, (customer, balance) in enumerate(balances):
+			data['form-%d-id' % i] = str(customer.pk)
+			data['form-%d-balance' % i] = balance
+		return customers(make_request('', self.user, 'POST', data), display_class)
+
+	def test_bulk_only_when_saves_are_plain(self):
+		display = EditableDisplaySet(Customer.objects.all(), DefaultDisplaySite)
+		self.assertTrue(display.use_bulk_edit())
+		saved = []
+		def receiver(sender, instance, **kwargs):
+			saved.append(instance.pk)
+		signals.post_save.connect(receiver, sender=Customer)
+		try:
+			self.assertFalse(display.use_bulk_edit())
+			response = self.post([(self.smith, '1.00'), (self.jones, '2.00')])
+		finally:
+			signals.post_save.disconnect(receiver, sender=Customer)
+		self.assertEqual(response.status_code, 302)
+		self.assertEqual(sorted(saved), sorted([self.smith.pk, self.jones.pk]))
+
+	def test_rows_with_the_same_values_share_an_update(self):
+		balances = [(self.smith, '5.00'), (self.jones, '5.00'), (self.brown, '7.00')]
+		with CaptureQueries() as captured:
+			response = self.post(balances, EditedDisplaySet)
+		self.assertEqual(response.status_code, 302)
+		updates = [q['sql'] for q in captured.queries if q['sql'].startswith('UPDATE')]
+		self.assertEqual(len(updates), 2, updates)
+		inserts = [q['sql'] for q in captured.queries if 'INSERT' in q['sql']]
+		self.assertEqual(len(inserts), 1, inserts)
+		self.assertEqual([c.balance for c in Customer.objects.order_by('pk')], [5, 5, 7])
+		self.assertEqual(LogEntry.objects.filter(action_flag=2).count(), 3)
+
+class ParallelExportDisplaySet(ExportDisplaySet):
+	export_processes = 2
+	export_chunk_size = 1
+	export_worker_chunk_size = 2
+
+class ParallelExportTests(DisplaySetMixin, TransactionTestCase):
+	def test_same_csv_as_one_process(self):
+		queryset = Customer.objects.order_by('-balance')
+		expected = ''.join(csv_stream(ExportDisplaySet(queryset, DefaultDisplaySite), queryset))
+		display = ParallelExportDisplaySet(queryset, DefaultDisplaySite)
+		self.assertEqual(''.join(parallel_csv_stream(display, queryset, display.export_processes)), expected)
+
+class ConcurrentCountDisplaySet(CustomerDisplaySet):
+	concurrent_count = True
+	list_per_page = 2
+
+class ConcurrentCountTests(DisplaySetMixin, TransactionTestCase):
+	def test_counts_beside_the_page(self):
+		cl = self.changelist('', ConcurrentCountDisplaySet)
+		self.assertEqual((cl.result_count, len(cl.result_list)), (3, 2))
+		cl = self.changelist('q=Denver', ConcurrentCountDisplaySet)
+		self.assertEqual(cl.result_count, 2)
+		self.assertEqual(sorted([obj.last_name for obj in cl.result_list]), ['Brown', 'Jones'])
+		self.assertEqual(self.get('p=1', ConcurrentCountDisplaySet).status_code, 200)
+
+	def test_workers_keep_their_connection(self):
+		pool = CountPool(1)
+		seen = []
+		def strategy(queryset):
+			count = queryset.count()
+			seen.append((threading.current_thread(), connections[queryset.db].connection))
+			return count
+		self.assertEqual(pool.submit(strategy, Customer.objects.all()).result(), 3)
+		self.assertEqual(pool.submit(strategy, Customer.objects.filter(last_name='Smith')).result(), 1)
+		self.assertEqual(len(seen), 2)
+		self.assertTrue(seen[0][1] is not None and seen[0] == seen[1])
+
+	def test_errors_reach_the_caller(self):
+		def strategy(queryset):
+			raise ValueError('count failed')
+		self.assertRaises(ValueError, CountPool(1).submit(strategy, Customer.objects.all()).result)
+
+class ThreadedRequestTests(DisplaySetMixin, TransactionTestCase):
+	threads = 8
+	requests = 10
+
+	def test_concurrent_requests_share_no_state(self):
+		before = (list(SharedDisplaySet.actions), list(SharedDisplaySet.list_display),
+			list(SharedDisplaySet.default_list_display))
+		searches = [('q=Smith', ['Smith'], ['Jones', 'Brown']), ('q=Denver', ['Jones', 'Brown'], ['Smith'])]
+		errors = []
+
+		def work(n):
+			try:
+				for i in range(self.requests):
+					query_string, shown, hidden = searches[(n + i) % 2]
+					content = self.get(query_string, SharedDisplaySet).content
+					for name in shown:
+						if name not in content:
+							errors.append('%s missing from %s' % (name, query_string))
+					for name in hidden:
+						if name in content:
+							errors.append('%s shown for %s' % (name, query_string))
+			except Exception as e:
+				errors.append(repr(e))
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=work, args=(n,)) for n in range(self.threads)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(errors, [])
+		self.assertEqual((list(SharedDisplaySet.actions), list(SharedDisplaySet.list_display),
+			list(SharedDisplaySet.default_list_display)), before)
+		display = SharedDisplaySet(Customer.objects.all(), DefaultDisplaySite)
+		self.assertEqual(display.list_display.count('last_name'), 1)
+		self.assertEqual(sorted(display.get_actions(make_request('', self.user)).keys()), ['csv_export', 'mark_open'])
+
+def linked_name(obj):
+	return u'<a href="%s">%s</a>' % (obj.get_absolute_url(), obj.last_name)
+linked_name.allow_tags = True
+
+def is_rich(obj):
+	return obj.balance > 15
+is_rich.boolean = True
+
+class RowsDisplaySet(CustomerDisplaySet):
+	list_display = ('first_name', linked_name, is_rich, 'address', 'added', 'closed', 'is_open', 'get_absolute_url', 'notes')
+
+	def notes(self, obj):
+		return u'<%s>' % obj.last_name
+
+class ResultRowTests(DisplaySetTestCase):
+	def rows(self, cl):
+		return [list(row) for row in displayset_result_list(cl)['results']]
+
+	def admin_rows(self, cl):
+		return [list(row) for row in result_list(cl)['results']]
+
+	def test_rows_match_the_admin(self):
+		self.smith.closed = datetime.datetime(2011, 5, 1, 12, 30)
+		self.smith.save()
+		for display_class in (CustomerDisplaySet, SharedDisplaySet, RowsDisplaySet):
+			cl = self.changelist('', display_class)
+			cl.formset = None
+			self.assertEqual(self.rows(cl), self.admin_rows(cl))
+
+	def test_editable_rows_match_the_admin(self):
+		cl = self.changelist('', EditableDisplaySet)
+		FormSet = cl.model_admin.get_changelist_formset(make_request('', self.user))
+		cl.formset = FormSet(queryset=cl.result_list)
+		self.assertEqual(self.rows(cl), self.admin_rows(cl))
+		self.assertEqual([row.form for row in displayset_result_list(cl)['results']], cl.formset.forms)
+
+class AggregateTests(DisplaySetTestCase):
+	def test_cached_per_aggregate_spec(self):
+		queryset = Customer.objects.all()
+		self.assertEqual(get_aggregates(queryset, {'balance': Sum}, 60), ({'balance': 60}, 3))
+		self.assertEqual(get_aggregates(queryset, {'balance': Max}, 60), ({'balance': 30}, 3))
+
+	def test_empty_queryset(self):
+		self.assertEqual(get_aggregates(Customer.objects.filter(pk__in=[]), {'balance': Sum}, 60), ({'balance': None}, 0))
+
+	def test_distinct_search(self):
+		Contact.objects.create(customer=self.smith, note='billing again')
+		Contact.objects.create(customer=self.smith, note='billing once more')
+		cl = self.changelist('q=billing', TotalsDisplaySet)
+		self.assertEqual(cl.result_count, 1)
+		self.assertEqual(cl.aggregate_row, [None, None, None, 10])
+		self.assertEqual([obj.pk for obj in cl.result_list], [self.smith.pk])
+
+	def test_footer_renders_in_the_results_table(self):
+		content = self.get('', TotalsDisplaySet).content
+		table = content[content.index('id="result_list"'):content.index('</table>')]
+		self.assertTrue('<tfoot>' in table)
+		self.assertTrue('<strong>60' in table)
+		self.assertFalse('<script' in content[content.index('id="result_list"'):])
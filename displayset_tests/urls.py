@@ -0,0 +1,10 @@
+from django.conf.urls.defaults import *
+from django.contrib import admin
+
+from displayset_tests import displays
+
+urlpatterns = patterns('',
+	(r'^customers/$', displays.customers),
+	(r'^redirect/$', displays.customers, {'display_class': displays.RedirectDisplaySet}),
+	(r'^admin/', include(admin.site.urls)),
+)
@@ -0,0 +1,68 @@
+"""
+Summary rows for DisplaySets.
+
+	class InvoiceDisplaySet(DisplaySet):
+		list_display = ('number', customer, 'amount', 'days_open')
+		list_aggregates = {'amount': Sum, 'days_open': Avg}
+
+The aggregates are worked out in one aggregate() query over the filtered
+results, which counts them too, so the page needs no separate COUNT(*).
+With count_strategy = 'cached' they're cached along with the count.
+DisplayList.aggregate_row lines them up under the columns for the footer,
+and csv and Excel exports end with the same row. A callable column shows
+the aggregate of its admin_order_field.
+"""
+try:
+	from hashlib import md5
+except ImportError:
+	from md5 import new as md5
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from django_displayset.counts import queryset_cache_key
+
+COUNT_ALIAS = 'displayset_count'
+
+def aggregate_alias(field, function):
+	return '%s__%s' % (field, function.__name__.lower())
+
+def get_aggregates(queryset, list_aggregates, timeout=None):
+	"""
+	Returns ({field: value}, count) for list_aggregates over queryset,
+	cached for timeout seconds when a timeout is given and queryset has a
+	query to key on.
+	"""
+	key = None
+	if timeout:
+		key = queryset_cache_key(queryset, 'displayset.aggregates')
+	if key:
+		# the same rows with other list_aggregates are cached apart
+		spec = sorted([(field, function.__name__) for field, function in list_aggregates.items()])
+		key = '%s.%s' % (key, md5(repr(spec)).hexdigest())
+		cached = cache.get(key)
+		if cached is not None:
+			return cached
+
+	kwargs = dict([(aggregate_alias(field, function), function(field))
+		for field, function in list_aggregates.items()])
+	kwargs[COUNT_ALIAS] = Count('pk')
+	if queryset.query.distinct:
+		# SELECT DISTINCT SUM(...) still sums the rows a join repeats, so
+		# aggregate over the distinct pks instead
+		queryset = queryset.model._base_manager.filter(pk__in=queryset.values('pk'))
+	values = queryset.order_by().aggregate(**kwargs)
+	result = (dict([(field, values[aggregate_alias(field, function)])
+		for field, function in list_aggregates.items()]), values[COUNT_ALIAS] or 0)
+	if key:
+		cache.set(key, result, timeout)
+	return result
+
+def column_field(column):
+	if callable(column):
+		return getattr(column, 'admin_order_field', None)
+	return column
+
+def aggregate_row(columns, aggregates):
+	"The aggregates under columns, None where a column has none."
+	return [aggregates.get(column_field(column)) for column in columns]
@@ -0,0 +1,131 @@
+"""
+Batched list_editable saves.
+
+The admin saves each changed row of a list_editable page on its own: a
+save_model, a save_m2m and a LogEntry insert per row. save_changed_forms
+instead updates the changed rows on just the fields that changed, grouped by
+those fields, and writes their LogEntries together, all in one transaction.
+
+Rows are written with QuerySet.update (or bulk_update where the ORM has it),
+so save() and the pre_save/post_save signals are not run for them. That's
+why DisplaySet.list_editable_bulk, left as None, only saves this way when
+nothing hooks into the model's saves (see saves_are_plain).
+"""
+from django.contrib.admin.models import LogEntry, CHANGE
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, models, router, transaction
+from django.db.models import signals
+from django.dispatch.dispatcher import _make_id
+from django.utils.encoding import force_unicode
+
+def commit_together(using):
+	"transaction.atomic where there is one, else commit_on_success, for the database using."
+	wrapper = getattr(transaction, 'atomic', None) or transaction.commit_on_success
+	return wrapper(using=using)
+
+def has_receivers(signal, sender):
+	if hasattr(signal, 'has_listeners'):
+		return signal.has_listeners(sender)
+	return bool(signal._live_receivers(_make_id(sender)))
+
+def saves_are_plain(model):
+	"""
+	True if skipping model's save() loses nothing: it isn't overridden and
+	no pre_save or post_save receivers are connected for it.
+	"""
+	save = getattr(model.save, '__func__', model.save)
+	if save is not getattr(models.Model.save, '__func__', models.Model.save):
+		return False
+	return not (has_receivers(signals.pre_save, model) or has_receivers(signals.post_save, model))
+
+def update_fields(form, opts):
+	"""
+	The names of the concrete fields form changed on its instance, plus the
+	auto_now fields, which save() would otherwise have set.
+	"""
+	names = []
+	for field in opts.fields:
+		if field.name in form.changed_data and not field.primary_key:
+			names.append(field.name)
+		elif getattr(field, 'auto_now', False):
+			setattr(form.instance, field.attname, field.pre_save(form.instance, False))
+			names.append(field.name)
+	return tuple(names)
+
+def update_objects(manager, objects, fields):
+	if hasattr(manager, 'bulk_update'):
+		manager.bulk_update(objects, fields)
+		return
+	# one UPDATE for each set of values, which list_editable pages often share
+	opts = manager.model._meta
+	attnames = [opts.get_field(name).attname for name in fields]
+	groups = {}
+	for obj in objects:
+		values = tuple([getattr(obj, attname) for attname in attnames])
+		try:
+			groups.setdefault(values, []).append(obj.pk)
+		except TypeError: # unhashable values are updated on their own
+			manager.filter(pk=obj.pk).update(**dict(zip(fields, values)))
+	for values, pks in groups.items():
+		manager.filter(pk__in=pks).update(**dict(zip(fields, values)))
+
+def insert_entries(entries):
+	"Inserts LogEntries with one executemany, for ORMs without bulk_create."
+	using = router.db_for_write(LogEntry)
+	connection = connections[using]
+	opts = LogEntry._meta
+	qn = connection.ops.quote_name
+	fields = [f for f in opts.local_fields if not isinstance(f, models.AutoField)]
+	sql = 'INSERT INTO %s (%s) VALUES (%s)' % (qn(opts.db_table),
+		', '.join([qn(f.column) for f in fields]), ', '.join(['%s'] * len(fields)))
+	params = [[f.get_db_prep_save(f.pre_save(entry, True), connection=connection) for f in fields]
+		for entry in entries]
+	connection.cursor().executemany(sql, params)
+	transaction.set_dirty(using=using)
+
+def log_changes(modeladmin, request, changes):
+	"Writes a CHANGE LogEntry for each (obj, message) in changes."
+	content_type = ContentType.objects.get_for_model(modeladmin.model)
+	entries = [LogEntry(
+		user_id=request.user.pk,
+		content_type_id=content_type.pk,
+		object_id=force_unicode(obj.pk),
+		object_repr=force_unicode(obj)[:200],
+		action_flag=CHANGE,
+		change_message=message,
+	) for obj, message in changes]
+	if hasattr(LogEntry.objects, 'bulk_create'):
+		LogEntry.objects.bulk_create(entries)
+	else:
+		insert_entries(entries)
+
+def save_changed_forms(modeladmin, request, formset):
+	"""
+	Saves the changed forms of a valid list_editable formset in one
+	transaction. Returns the saved objects.
+	"""
+	opts = modeladmin.model._meta
+	manager = modeladmin.model._base_manager
+	m2m_names = set([field.name for field in opts.many_to_many])
+	using = formset.get_queryset().db
+
+	def save():
+		groups = {}
+		changes = []
+		for form in formset.forms:
+			if not form.has_changed():
+				continue
+			obj = modeladmin.save_form(request, form, change=True)
+			groups.setdefault(update_fields(form, opts), []).append(obj)
+			if m2m_names.intersection(form.changed_data):
+				form.save_m2m()
+			changes.append((obj, modeladmin.construct_change_message(request, form, None)))
+
+		for fields, objects in groups.items():
+			if fields:
+				update_objects(manager.db_manager(using), objects, fields)
+		if changes:
+			log_changes(modeladmin, request, changes)
+		return [obj for obj, message in changes]
+
+	return commit_together(using)(save)()
@@ -0,0 +1,214 @@
+"""
+Column plans for DisplaySets.
+
+A list_display is compiled once into a header and one accessor callable per
+column, so exports (and anything else walking rows) can run the accessors
+row by row without re-inspecting each field for every cell. The model field
+behind each column is looked up once too, for the changelist's own rows.
+
+Columns can also declare the data they read, so a page or an export can load
+it for all rows at once rather than one query per row:
+
+	def last_contacted(obj):
+		return obj.last_contact_date
+	last_contacted.annotations = {'last_contact_date': Max('contact__date')}
+	last_contacted.select_related = ('address',)
+	last_contacted.prefetch_related = ('contact_set',)
+"""
+import operator
+import re
+
+from django.db.models.fields import FieldDoesNotExist
+
+from django_displayset.search import lookup_spawns_duplicates
+
+html_re = re.compile("<.*>(.*)</.*>")
+
+def column_header(field):
+	if callable(field):
+		try:
+			return field.short_description
+		except AttributeError:
+			return field.__name__
+	return field
+
+def strip_html(func):
+	def accessor(obj):
+		text = func(obj)
+		try:
+			return html_re.search(text).groups()[0]
+		except (TypeError,AttributeError): # either we got something like a datetime or no match was found (no html, so its clean)
+			return text
+	return accessor
+
+def attribute_accessor(name):
+	# 'address__zip' follows the relation just like obj.address.zip
+	getter = operator.attrgetter(name.replace('__', '.'))
+	def accessor(obj):
+		try:
+			return getter(obj)
+		except AttributeError:
+			return "(None)"
+	return accessor
+
+def concrete_field(opts, path):
+	"""
+	The non-relational field path ends at, following forward relations only,
+	or None when path isn't such a field.
+	"""
+	names = path.split('__')
+	for i, name in enumerate(names):
+		try:
+			field, model, direct, m2m = opts.get_field_by_name(name)
+		except FieldDoesNotExist:
+			return None
+		if m2m or not direct:
+			return None
+		last = i == len(names) - 1
+		if getattr(field, 'rel', None):
+			if last:
+				return None
+			opts = field.rel.to._meta
+		elif last:
+			return field
+		else:
+			return None
+
+def model_field(opts, name):
+	"The model field the admin renders name with, None for anything else."
+	if callable(name):
+		return None
+	try:
+		return opts.get_field(name)
+	except FieldDoesNotExist:
+		return None
+
+def column_accessor(field):
+	if callable(field):
+		return strip_html(field)
+	return attribute_accessor(field)
+
+def add_unique(items, into):
+	for item in items:
+		if item not in into:
+			into.append(item)
+
+class QueryPlan(object):
+	"""
+	The select_related paths, prefetch_related lookups and annotations the
+	columns of a list_display depend on, merged into one. '__' fields that
+	follow forward relations add their path to select_related.
+	"""
+	def __init__(self, fields, opts):
+		self.select_related = []
+		self.prefetch_related = []
+		self.annotations = {}
+		for f in fields:
+			if callable(f):
+				add_unique(getattr(f, 'select_related', ()), self.select_related)
+				add_unique(getattr(f, 'prefetch_related', ()), self.prefetch_related)
+				self.annotations.update(getattr(f, 'annotations', {}))
+			elif '__' in f and not lookup_spawns_duplicates(opts, f):
+				add_unique([f.rsplit('__', 1)[0]], self.select_related)
+
+	def apply(self, queryset, select_related=()):
+		"""
+		Returns queryset loading everything the columns need. Prefetching
+		needs a Django with prefetch_related, older ones skip it.
+		"""
+		select_related = list(select_related)
+		add_unique(self.select_related, select_related)
+		if select_related:
+			queryset = queryset.select_related(*select_related)
+		if self.prefetch_related and hasattr(queryset, 'prefetch_related'):
+			queryset = queryset.prefetch_related(*self.prefetch_related)
+		annotations = self.missing_annotations(queryset)
+		if annotations:
+			queryset = queryset.annotate(**annotations)
+		return queryset
+
+	def missing_annotations(self, queryset, names=None):
+		"The annotations, or those of names, that queryset doesn't have yet."
+		query = queryset.query
+		present = getattr(query, 'annotations', None)
+		if present is None:
+			present = query.aggregates
+		return dict([(name, annotation) for name, annotation in self.annotations.items()
+			if name not in present and (names is None or name in names)])
+
+	def iterate(self, queryset, chunk_size, select_related=()):
+		"""
+		Yields the objects of queryset with the plan applied, without holding
+		them all in memory. Prefetches don't work with iterator(), so when
+		there are any, rows are fetched in chunks of chunk_size pks instead.
+		"""
+		planned = self.apply(queryset, select_related)
+		if not (self.prefetch_related and hasattr(planned, 'prefetch_related')):
+			for obj in planned.iterator():
+				yield obj
+			return
+
+		pks = list(queryset.values_list('pk', flat=True))
+		for i in range(0, len(pks), chunk_size):
+			chunk = pks[i:i+chunk_size]
+			objects = dict([(obj.pk, obj) for obj in planned.filter(pk__in=chunk)])
+			for pk in chunk:
+				if pk in objects:
+					yield objects[pk]
+
+class ColumnPlan(object):
+	"""
+	The compiled form of a list_display: fields, header labels, accessors and
+	the QueryPlan feeding them, with 'action_checkbox' left out.
+	model_fields maps every entry of list_display to its model field or None.
+
+	When every column is a plain field, values_fields lists them so rows can
+	be read with values_list() instead of building model instances, and
+	only_fields is what only() needs to load just those columns.
+	"""
+	def __init__(self, list_display, opts):
+		self.fields = [f for f in list_display if f != 'action_checkbox']
+		self.header = [column_header(f) for f in self.fields]
+		self.accessors = [column_accessor(f) for f in self.fields]
+		self.query_plan = QueryPlan(self.fields, opts)
+		self.model_fields = dict([(f, model_field(opts, f)) for f in list_display])
+		self.values_fields = self.only_fields = None
+		if self.fields and not [f for f in self.fields if callable(f) or concrete_field(opts, f) is None]:
+			self.values_fields = list(self.fields)
+			self.only_fields = []
+			for f in self.fields:
+				names = f.split('__')
+				# the foreign keys along a path have to be loaded too
+				add_unique(['__'.join(names[:i]) for i in range(1, len(names) + 1)], self.only_fields)
+
+	def row(self, obj):
+		return [accessor(obj) for accessor in self.accessors]
+
+	def rows(self, objects):
+		accessors = self.accessors
+		for obj in objects:
+			yield [accessor(obj) for accessor in accessors]
+
+	def export_rows(self, queryset, chunk_size, select_related=(), fast=True):
+		"""
+		The rows of queryset for an export: tuples straight from values_list
+		when fast is on and every column is a plain field, otherwise the
+		accessors run over the planned objects.
+		"""
+		if fast and self.values_fields:
+			return queryset.values_list(*self.values_fields).iterator()
+		return self.rows(self.query_plan.iterate(queryset, chunk_size, select_related))
+
+_column_plans = {}
+
+def get_column_plan(modeladmin):
+	"""
+	Returns the ColumnPlan for modeladmin.list_display. Plans are cached per
+	DisplaySet class and rebuilt whenever its list_display changes.
+	"""
+	key = (modeladmin.model, tuple(modeladmin.list_display))
+	cached = _column_plans.get(modeladmin.__class__)
+	if cached is None or cached[0] != key:
+		cached = (key, ColumnPlan(key[1], modeladmin.model._meta))
+		_column_plans[modeladmin.__class__] = cached
+	return cached[1]
@@ -0,0 +1,182 @@
+"""
+Count strategies for DisplayList.
+
+A strategy is called with a queryset and returns the number of rows to report
+for it. Strategies that are cheap for a queryset (see is_cheap) are also used
+for full_result_count.
+"""
+import Queue
+import re
+import threading
+
+try:
+	from hashlib import md5
+except ImportError:
+	from md5 import new as md5
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.sql import EmptyResultSet
+from django.utils.encoding import smart_str
+
+def queryset_cache_key(queryset, prefix):
+	"""
+	A cache key for queryset built from its SQL and parameters, so querysets
+	that would run the same query share a key. None for a queryset that
+	can't match anything (e.g. pk__in=[]) and so has no SQL.
+	"""
+	try:
+		sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+	except EmptyResultSet:
+		return None
+	digest = md5(smart_str(' '.join(sql.split())) + smart_str(repr(params))).hexdigest()
+	return '%s.%s.%s' % (prefix, queryset.db, digest)
+
+class ExactCount(object):
+	"Always runs COUNT(*)."
+	cheap = False
+
+	def __call__(self, queryset):
+		return queryset.count()
+
+	def is_cheap(self, queryset):
+		return self.cheap
+
+class CachedCount(ExactCount):
+	"Runs COUNT(*) once and keeps the result in the cache for timeout seconds."
+	cheap = True
+
+	def __init__(self, timeout=300):
+		self.timeout = timeout
+
+	def __call__(self, queryset):
+		key = queryset_cache_key(queryset, 'displayset.count')
+		if key is None:
+			return queryset.count()
+		count = cache.get(key)
+		if count is None:
+			count = queryset.count()
+			cache.set(key, count, self.timeout)
+		return count
+
+class EstimatedCount(ExactCount):
+	"""
+	Uses the query planner's row estimate when it is above threshold, and an
+	exact count below it. Only PostgreSQL gives an estimate; other databases
+	(SQLite included) always get the exact count, so it's only cheap there.
+	"""
+	rows_re = re.compile(r'rows=(\d+)')
+
+	def __init__(self, threshold=100000):
+		self.threshold = threshold
+
+	def can_estimate(self, queryset):
+		return 'postgresql' in connections[queryset.db].settings_dict['ENGINE']
+
+	def is_cheap(self, queryset):
+		return self.can_estimate(queryset)
+
+	def estimate(self, queryset):
+		if not self.can_estimate(queryset):
+			return None
+		try:
+			sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+		except EmptyResultSet:
+			return None
+		connection = connections[queryset.db]
+		cursor = connection.cursor()
+		cursor.execute('EXPLAIN %s' % sql, params)
+		match = self.rows_re.search(cursor.fetchone()[0])
+		if match:
+			return int(match.group(1))
+		return None
+
+	def __call__(self, queryset):
+		estimate = self.estimate(queryset)
+		if estimate is not None and estimate > self.threshold:
+			return estimate
+		return queryset.count()
+
+def is_cheap(strategy, queryset):
+	"Whether strategy counts queryset without a full COUNT(*)."
+	if hasattr(strategy, 'is_cheap'):
+		return strategy.is_cheap(queryset)
+	return getattr(strategy, 'cheap', False)
+
+class CountJob(object):
+	"""
+	strategy(queryset), run by a CountPool worker on that worker's own
+	database connection. The count can't see rows written by an uncommitted
+	transaction of the calling thread.
+	"""
+	def __init__(self, strategy, queryset):
+		self.strategy = strategy
+		self.queryset = queryset
+		self.count = None
+		self.error = None
+		self.done = threading.Event()
+
+	def run(self):
+		connection = connections[self.queryset.db]
+		try:
+			try:
+				self.count = self.strategy(self.queryset)
+			except Exception as e:
+				self.error = e
+				# connect afresh next time in case the connection broke
+				connection.close()
+			else:
+				# end the read's transaction rather than idle in it until the next count
+				connection._rollback()
+		finally:
+			self.done.set()
+
+	def result(self):
+		"Waits for the count and returns it, raising whatever the strategy raised."
+		self.done.wait()
+		if self.error is not None:
+			raise self.error
+		return self.count
+
+class CountPool(object):
+	"""
+	size worker threads running CountJobs. Database connections belong to a
+	thread, so each worker keeps its connection open from one count to the
+	next instead of connecting for every page view. The workers start with
+	the first count and are daemons, so they never hold up an exit.
+
+	Running the count beside the page query only pays when the count is
+	slow enough to outweigh handing it to another thread: on a cheap count
+	(a small table, a CachedCount hit) it's a loss. With every worker busy,
+	counts wait their turn.
+	"""
+	def __init__(self, size=4):
+		self.size = size
+		self.jobs = Queue.Queue()
+		self.workers = []
+		self.lock = threading.Lock()
+
+	def start(self):
+		self.lock.acquire()
+		try:
+			while len(self.workers) < self.size:
+				worker = threading.Thread(target=self.work)
+				worker.daemon = True
+				worker.start()
+				self.workers.append(worker)
+		finally:
+			self.lock.release()
+
+	def work(self):
+		while True:
+			self.jobs.get().run()
+
+	def submit(self, strategy, queryset):
+		"Starts counting queryset with strategy and returns its CountJob."
+		if len(self.workers) < self.size:
+			self.start()
+		job = CountJob(strategy, queryset)
+		self.jobs.put(job)
+		return job
+
+count_pool = CountPool()
@@ -0,0 +1,380 @@
+"""
+Exporters for DisplaySets.
+
+Each exporter streams a queryset through the DisplaySet's column plan in
+batches of export_chunk_size rows and is registered as an admin action named
+<format>_export. The actions are batched (see DisplaySet.run_action), so a
+selection is read action_batch_size pks at a time. A DisplaySet picks its formats with export_formats:
+
+	class DisplaySetSubclass(DisplaySet):
+		export = True
+		export_formats = ('csv', 'xlsx', 'jsonl', 'parquet')
+		export_name = "display_report" ####makes the file name display_report.csv
+		export_chunk_size = 500 ####rows per chunk sent to the client
+
+xlsx needs openpyxl and parquet needs pyarrow.
+"""
+import csv
+import datetime
+import decimal
+import operator
+import tempfile
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.encoding import force_unicode, smart_str
+
+from django_displayset.aggregates import aggregate_row
+from django_displayset.columns import get_column_plan, concrete_field
+
+PLAIN_TYPES = (basestring, bool, int, long, float, decimal.Decimal,
+	datetime.date, datetime.datetime, datetime.time)
+
+def cell_value(value):
+	"value if file formats can store it as is, otherwise its text."
+	if value is None or isinstance(value, PLAIN_TYPES):
+		return value
+	return force_unicode(value)
+
+def fast_rows(modeladmin):
+	return getattr(modeladmin, 'fast_rows', None) is not False
+
+def chunks(rows, size):
+	batch = []
+	for row in rows:
+		batch.append(row)
+		if len(batch) >= size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+def ordering(queryset):
+	"""
+	The fields queryset is ordered by, as (name, descending) pairs, or None
+	when the order can't be read back from its rows (random or extra
+	ordering).
+	"""
+	query = queryset.query
+	if query.extra_order_by:
+		return None
+	fields = query.order_by or (query.default_ordering and queryset.model._meta.ordering) or []
+	if '?' in fields:
+		return None
+	return [(f.lstrip('-'), f.startswith('-')) for f in fields]
+
+def ordered_batches(queryset, batches):
+	"""
+	The selected pks in batches, re-cut in queryset's order so exporting
+	batch by batch keeps the report's order. A single batch is already
+	ordered by its query; for several, each batch reads its pks with the
+	fields they're ordered by, and those are merged.
+	"""
+	if len(batches) <= 1:
+		return batches
+	size = max([len(batch) for batch in batches])
+	fields = ordering(queryset)
+	if fields is None:
+		selected = set([unicode(pk) for batch in batches for pk in batch])
+		pks = [pk for pk in queryset.values_list('pk', flat=True).iterator() if unicode(pk) in selected]
+	else:
+		rows = []
+		for batch in batches:
+			rows.extend(queryset.filter(pk__in=batch).values_list('pk', *[name for name, descending in fields]))
+		rows.sort(key=operator.itemgetter(0))
+		# stable sorts, least significant field first
+		for i in reversed(range(len(fields))):
+			rows.sort(key=operator.itemgetter(i + 1), reverse=fields[i][1])
+		pks = [row[0] for row in rows]
+	return [pks[i:i+size] for i in range(0, len(pks), size)]
+
+def selection(queryset, batches=None):
+	"""
+	queryset, or a queryset for each batch of selected pks of it, so no
+	query has more parameters than a batch.
+	"""
+	if batches is None:
+		return [queryset]
+	return [queryset.filter(pk__in=batch) for batch in ordered_batches(queryset, batches)]
+
+def file_chunks(output, size=64 * 1024):
+	"Yields the contents of output, then closes it."
+	output.seek(0)
+	try:
+		while True:
+			data = output.read(size)
+			if not data:
+				break
+			yield data
+	finally:
+		output.close()
+
+def csv_row(row):
+	"row with its text as UTF-8 bytes, the only text Python 2's csv module writes."
+	return [isinstance(value, unicode) and smart_str(value) or value for value in row]
+
+class EchoBuffer(object):
+	"""
+	A file-like object that hands back whatever is written to it, so a
+	csv.writer can format rows for a streaming response.
+	"""
+	def write(self, value):
+		return value
+
+def csv_stream(modeladmin, queryset, progress=None, batches=None):
+	"""
+	Yields the csv export of queryset, or of the batches of selected pks of
+	it, in chunks of export_chunk_size rows.
+
+	The queryset is read with iterator() so the result cache never holds
+	every row, and the header goes out before the first row is fetched.
+	progress, if given, is called with the number of rows written so far
+	after every chunk.
+	"""
+	chunk_size = getattr(modeladmin, 'export_chunk_size', None) or 500
+	plan = get_column_plan(modeladmin)
+	writer = csv.writer(EchoBuffer())
+	yield writer.writerow(csv_row(plan.header))
+
+	lines = []
+	written = 0
+	for part in selection(queryset, batches):
+		rows = plan.export_rows(part, chunk_size,
+			getattr(modeladmin, 'after_pagination_select_related', ()), fast_rows(modeladmin))
+		for row in rows:
+			lines.append(writer.writerow(csv_row(row)))
+			if len(lines) >= chunk_size:
+				yield ''.join(lines)
+				written += len(lines)
+				lines = []
+				if progress:
+					progress(written)
+	if lines:
+		yield ''.join(lines)
+		if progress:
+			progress(written + len(lines))
+
+def cpu_count():
+	try:
+		import multiprocessing
+		return multiprocessing.cpu_count()
+	except (ImportError, NotImplementedError):
+		return 1
+
+def export_stream(modeladmin, queryset, progress=None, batches=None):
+	"""
+	The csv_stream of queryset, formatted by export_processes worker
+	processes when that's set. No more processes are used than there are
+	CPUs, and with only one csv_stream formats it in this process.
+	"""
+	processes = min(getattr(modeladmin, 'export_processes', None) or 1, cpu_count())
+	if processes > 1:
+		from django_displayset.parallel import parallel_csv_stream
+		return parallel_csv_stream(modeladmin, queryset, processes, progress, batches)
+	return csv_stream(modeladmin, queryset, progress, batches)
+
+def summary_row(modeladmin, queryset, plan, batches=None):
+	"""
+	The list_aggregates row that ends an export of queryset, or None. A
+	selection too big for one query gets none.
+	"""
+	if not getattr(modeladmin, 'list_aggregates', None):
+		return None
+	if batches is not None:
+		if len(batches) != 1:
+			return None
+		queryset = queryset.filter(pk__in=batches[0])
+	return aggregate_row(plan.fields, modeladmin.get_aggregates(queryset)[0])
+
+class Exporter(object):
+	name = None
+	extension = None
+	content_type = None
+	label = None
+
+	def stream(self, modeladmin, queryset, progress=None, batches=None):
+		"""
+		Yields the exported file of queryset, or of the batches of selected
+		pks of it, in chunks.
+		"""
+		raise NotImplementedError
+
+	def rows(self, modeladmin, queryset, plan, batches=None):
+		for part in selection(queryset, batches):
+			for row in plan.export_rows(part, self.chunk_size(modeladmin),
+					getattr(modeladmin, 'after_pagination_select_related', ()), fast_rows(modeladmin)):
+				yield row
+
+	def chunk_size(self, modeladmin):
+		return getattr(modeladmin, 'export_chunk_size', None) or 500
+
+class CSVExporter(Exporter):
+	name = 'csv'
+	extension = 'csv'
+	content_type = 'text/csv'
+	label = 'Export to CSV'
+
+	def stream(self, modeladmin, queryset, progress=None, batches=None):
+		for chunk in export_stream(modeladmin, queryset, progress, batches):
+			yield chunk
+		row = summary_row(modeladmin, queryset, get_column_plan(modeladmin), batches)
+		if row is not None:
+			yield csv.writer(EchoBuffer()).writerow(csv_row(row))
+
+class JSONLinesExporter(Exporter):
+	"One JSON object per row, keyed by column header."
+	name = 'jsonl'
+	extension = 'jsonl'
+	content_type = 'application/x-ndjson'
+	label = 'Export to JSON Lines'
+
+	def stream(self, modeladmin, queryset, progress=None, batches=None):
+		plan = get_column_plan(modeladmin)
+		header = [force_unicode(h) for h in plan.header]
+		encoder = DjangoJSONEncoder()
+		written = 0
+		for batch in chunks(self.rows(modeladmin, queryset, plan, batches), self.chunk_size(modeladmin)):
+			yield ''.join([encoder.encode(dict(zip(header, [cell_value(v) for v in row]))) + '\n' for row in batch])
+			written += len(batch)
+			if progress:
+				progress(written)
+
+class XLSXExporter(Exporter):
+	"""
+	An Excel workbook written with openpyxl's write-only mode, which keeps
+	rows on disk rather than in memory.
+	"""
+	name = 'xlsx'
+	extension = 'xlsx'
+	content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+	label = 'Export to Excel'
+
+	def stream(self, modeladmin, queryset, progress=None, batches=None):
+		import openpyxl
+		plan = get_column_plan(modeladmin)
+		workbook = openpyxl.Workbook(write_only=True)
+		sheet = workbook.create_sheet()
+		sheet.append([force_unicode(h) for h in plan.header])
+		written = 0
+		for batch in chunks(self.rows(modeladmin, queryset, plan, batches), self.chunk_size(modeladmin)):
+			for row in batch:
+				sheet.append([cell_value(v) for v in row])
+			written += len(batch)
+			if progress:
+				progress(written)
+		row = summary_row(modeladmin, queryset, plan, batches)
+		if row is not None:
+			sheet.append([cell_value(v) for v in row])
+		output = tempfile.TemporaryFile()
+		workbook.save(output)
+		for chunk in file_chunks(output):
+			yield chunk
+
+INTEGER_FIELDS = ('AutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+	'PositiveIntegerField', 'PositiveSmallIntegerField')
+
+def arrow_type(pyarrow, field):
+	"The Arrow type of a column showing field, string when it's not a plain field."
+	internal = field is not None and field.get_internal_type()
+	if internal in INTEGER_FIELDS:
+		return pyarrow.int64()
+	elif internal == 'FloatField':
+		return pyarrow.float64()
+	elif internal == 'DecimalField':
+		return pyarrow.decimal128(field.max_digits, field.decimal_places)
+	elif internal in ('BooleanField', 'NullBooleanField'):
+		return pyarrow.bool_()
+	elif internal == 'DateField':
+		return pyarrow.date32()
+	elif internal == 'DateTimeField':
+		return pyarrow.timestamp('us')
+	elif internal == 'TimeField':
+		return pyarrow.time64('us')
+	return pyarrow.string()
+
+def arrow_value(value, typed):
+	"""
+	value for a column of an Arrow type, or of strings when typed is off.
+	Text in a typed column, like the "(None)" of a missing relation, is null.
+	"""
+	if value is None:
+		return None
+	if not typed:
+		return force_unicode(value)
+	if isinstance(value, basestring):
+		return None
+	return value
+
+class ParquetExporter(Exporter):
+	"""
+	A Parquet file written one row group per batch with pyarrow. Column types
+	come from the model fields list_display shows, callables and anything
+	else being strings, so every batch fits the same schema.
+	"""
+	name = 'parquet'
+	extension = 'parquet'
+	content_type = 'application/octet-stream'
+	label = 'Export to Parquet'
+
+	def schema(self, pyarrow, modeladmin, plan):
+		opts = modeladmin.model._meta
+		fields = [pyarrow.field(force_unicode(h), arrow_type(pyarrow, not callable(f) and concrete_field(opts, f) or None))
+			for h, f in zip(plan.header, plan.fields)]
+		return pyarrow.schema(fields)
+
+	def stream(self, modeladmin, queryset, progress=None, batches=None):
+		import pyarrow
+		import pyarrow.parquet
+		plan = get_column_plan(modeladmin)
+		schema = self.schema(pyarrow, modeladmin, plan)
+		typed = [field.type != pyarrow.string() for field in schema]
+		output = tempfile.TemporaryFile()
+		writer = pyarrow.parquet.ParquetWriter(output, schema)
+		written = 0
+		for batch in chunks(self.rows(modeladmin, queryset, plan, batches), self.chunk_size(modeladmin)):
+			columns = zip(*batch)
+			arrays = [pyarrow.array([arrow_value(v, is_typed) for v in column], type=field.type)
+				for column, field, is_typed in zip(columns, schema, typed)]
+			writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+			written += len(batch)
+			if progress:
+				progress(written)
+		writer.close()
+		for chunk in file_chunks(output):
+			yield chunk
+
+def make_export_action(exporter):
+	def export_action(modeladmin, request, queryset, batches=None):
+		# Exports over export_background_threshold rows are handed to a job runner.
+		threshold = getattr(modeladmin, 'export_background_threshold', None)
+		if threshold is not None:
+			if batches is None:
+				count = modeladmin.get_count_strategy()(queryset)
+			else:
+				count = sum([len(batch) for batch in batches])
+			if count > threshold:
+				return modeladmin.export_in_background(request, queryset, exporter.name, batches)
+
+		# The response is built from a generator, so nothing is buffered here.
+		# Middleware that reads response.content (ETags, gzip) will consume it.
+		export_name = getattr(modeladmin, 'export_name', None) or queryset.model._meta.verbose_name
+		response = HttpResponse(exporter.stream(modeladmin, queryset, batches=batches), mimetype=exporter.content_type)
+		response['Content-Disposition'] = 'attachment; filename=%s.%s' % (export_name, exporter.extension)
+		return response
+	export_action.batched = True
+	export_action.__name__ = '%s_export' % exporter.name
+	export_action.short_description = exporter.label
+	return export_action
+
+EXPORTERS = {}
+
+def register_exporter(exporter):
+	"Makes exporter available to export_formats under exporter.name."
+	exporter.action = make_export_action(exporter)
+	EXPORTERS[exporter.name] = exporter
+	return exporter
+
+csv_export = register_exporter(CSVExporter()).action
+register_exporter(JSONLinesExporter())
+register_exporter(XLSXExporter())
+register_exporter(ParquetExporter())
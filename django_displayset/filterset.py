@@ -1,10 +1,109 @@
+import threading
+import time
+
+try:
+	from collections import OrderedDict
+except ImportError:
+	from django.utils.datastructures import SortedDict as OrderedDict
+
+from django.core.cache import cache
+from django.db.models import signals
+from django.utils.translation import get_language
+
 try:
 	import django_qfilters as project_filters
 except ImportError:
 	import django_filters as project_filters
 
+class LabelCache(object):
+	"""
+	A per-process LRU of pk -> unicode(obj) for the models shown in report
+	headers, keyed by model and a version kept in the Django cache. Saving or
+	deleting a row of a model bumps its version in every process, and the
+	stale labels age out of the LRU. Versions are timestamps, like the page
+	cache's, so one evicted from the cache never comes back as an old value.
+	Models have to be watched before their labels are cached; a
+	ParameterFilterSet watches those of its model choice filters.
+	"""
+	def __init__(self, maxsize=10000):
+		self.maxsize = maxsize
+		self.labels = OrderedDict()
+		self.watched = set()
+		self.lock = threading.Lock()
+
+	def version_key(self, model):
+		return 'displayset.labels.version.%s.%s' % (model._meta.app_label, model._meta.object_name.lower())
+
+	def version(self, model):
+		version = cache.get(self.version_key(model))
+		if version is None:
+			version = int(time.time() * 1000)
+			cache.add(self.version_key(model), version)
+		return version
+
+	def invalidate(self, sender, **kwargs):
+		cache.set(self.version_key(sender), int(time.time() * 1000))
+
+	def watch(self, model):
+		if model not in self.watched:
+			uid = self.version_key(model)
+			signals.post_save.connect(self.invalidate, sender=model, weak=False, dispatch_uid=uid + '.save')
+			signals.post_delete.connect(self.invalidate, sender=model, weak=False, dispatch_uid=uid + '.delete')
+			self.watched.add(model)
+
+	def resolve(self, model, pks):
+		"Returns {unicode(pk): label} for pks, querying only for the ones not cached."
+		self.watch(model)
+		version = self.version(model)
+		found = {}
+		missing = []
+		self.lock.acquire()
+		try:
+			for pk in pks:
+				key = (model, version, unicode(pk))
+				if key in self.labels:
+					# move it to the recently used end
+					found[key[2]] = self.labels[key] = self.labels.pop(key)
+				else:
+					missing.append(pk)
+		finally:
+			self.lock.release()
+
+		if missing:
+			fetched = [(unicode(o.pk), unicode(o)) for o in model._default_manager.filter(pk__in=missing)]
+			self.lock.acquire()
+			try:
+				for pk, label in fetched:
+					found[pk] = self.labels[(model, version, pk)] = label
+				while len(self.labels) > self.maxsize:
+					del self.labels[next(iter(self.labels))]
+			finally:
+				self.lock.release()
+		return found
+
+label_cache = LabelCache()
+
+def choice_index(choices):
+	return dict([(unicode(k), unicode(label)) for k, label in choices])
+
+# (FilterSet class, field name, language) -> (the filter's choices, their index)
+_choice_labels = {}
+
 class ParameterFilterSet(project_filters.FilterSet):
+	label_cache = label_cache
+
+	def __init__(self, *args, **kwargs):
+		super(ParameterFilterSet,self).__init__(*args, **kwargs)
+		# from here on saves to these models reach label_cache
+		for filter in self.filters.values():
+			queryset = filter.extra.get('queryset')
+			if queryset is not None:
+				self.label_cache.watch(queryset.model)
+
 	def get_parameters(self):
+		if getattr(self, '_parameters', None) is not None:
+			return self._parameters
+
 		parameters = []
 		skip_list = ['submit', 'q', 'o', 'ot', 'p']
 
@@ -13,5 +112,33 @@ class ParameterFilterSet(project_filters.FilterSet):
 				if self.data[h] and not h.lower() in skip_list:
 					parameters.append((h,k))
 
-		parameters = sorted(parameters)
-		return parameters
+		self._parameters = sorted(parameters)
+		return self._parameters
+
+	def resolve_labels(self, model, pks):
+		"Labels of the given pks of model for the report header, from label_cache."
+		return self.label_cache.resolve(model, pks)
+
+	def choice_labels(self, field_name):
+		"""
+		A {unicode(value): label} index of a form field's choices. When the
+		choices are declared on the filter, the index is built once per
+		FilterSet class, field and language, and rebuilt if the filter's
+		choices are replaced. Choices only found per instance, like
+		AllValuesFilter's, are indexed per FilterSet.
+		"""
+		base = self.base_filters.get(field_name)
+		choices = base is not None and base.extra.get('choices')
+		if not choices:
+			if not hasattr(self, '_choice_labels'):
+				self._choice_labels = {}
+			if field_name not in self._choice_labels:
+				self._choice_labels[field_name] = choice_index(self.form.fields[field_name].choices)
+			return self._choice_labels[field_name]
+
+		key = (self.__class__, field_name, get_language())
+		cached = _choice_labels.get(key)
+		if cached is None or cached[0] is not choices:
+			cached = (choices, choice_index(self.form.fields[field_name].choices))
+			_choice_labels[key] = cached
+		return cached[1]
@@ -0,0 +1,113 @@
+"""
+Opt-in timing of DisplaySet views.
+
+With DisplaySet.instrument on, each phase of changelist_view records its wall
+time and the SQL it ran. The results go out as a Server-Timing header, through
+the changelist_timed signal and, optionally, into the template context. When
+instrument is off every phase is a shared no-op.
+"""
+import time
+
+from django.db import connections
+from django.dispatch import Signal
+
+# Sent once a changelist response is ready, with sender set to the DisplaySet class.
+changelist_timed = Signal(providing_args=['displayset', 'request', 'response', 'timings'])
+
+def debug_cursor(connection):
+	"A cursor() for connection that always records its queries."
+	def cursor():
+		return connection.make_debug_cursor(connection._cursor())
+	return cursor
+
+class Phase(object):
+	"""
+	Times one phase. Debug cursors are forced on for the duration so queries
+	are recorded even when DEBUG is off; Django versions without
+	use_debug_cursor get a debug cursor() for the phase instead.
+	"""
+	def __init__(self, timings, name):
+		self.timings = timings
+		self.name = name
+		self.duration = 0.0
+		self.queries = 0
+		self.query_time = 0.0
+
+	def __enter__(self):
+		self._cursors = []
+		self._seen = []
+		for connection in connections.all():
+			if hasattr(connection, 'use_debug_cursor'):
+				self._cursors.append((connection, connection.use_debug_cursor))
+				connection.use_debug_cursor = True
+			else:
+				self._cursors.append((connection, debug_cursor))
+				connection.cursor = debug_cursor(connection)
+			self._seen.append(len(connection.queries))
+		self._start = time.time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.duration = time.time() - self._start
+		for (connection, use_debug_cursor), seen in zip(self._cursors, self._seen):
+			queries = connection.queries[seen:]
+			self.queries += len(queries)
+			self.query_time += sum([float(q['time']) for q in queries])
+			if use_debug_cursor is debug_cursor:
+				del connection.cursor
+			else:
+				connection.use_debug_cursor = use_debug_cursor
+		self.timings.phases.append(self)
+		return False
+
+class Timings(object):
+	"Collects the Phases of one request."
+	enabled = True
+
+	def __init__(self):
+		self.phases = []
+
+	def phase(self, name):
+		return Phase(self, name)
+
+	def total(self):
+		return sum([p.duration for p in self.phases])
+
+	def queries(self):
+		return sum([p.queries for p in self.phases])
+
+	def server_timing(self):
+		return ', '.join(['%s;dur=%.1f;desc="%d queries"' % (p.name, p.duration * 1000, p.queries)
+			for p in self.phases])
+
+	def finish(self, displayset, request, response):
+		response['Server-Timing'] = self.server_timing()
+		changelist_timed.send(sender=displayset.__class__, displayset=displayset,
+			request=request, response=response, timings=self)
+		return response
+
+class NullPhase(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+
+class NullTimings(object):
+	"Stands in for Timings when instrumentation is off."
+	enabled = False
+	phases = ()
+	_phase = NullPhase()
+
+	def phase(self, name):
+		return self._phase
+
+	def finish(self, displayset, request, response):
+		return response
+
+null_timings = NullTimings()
+
+def get_timings(display_class):
+	if display_class.instrument:
+		return Timings()
+	return null_timings
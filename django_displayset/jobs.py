@@ -0,0 +1,239 @@
+"""
+Background exports.
+
+An export too big to stream from a web worker is described by a picklable
+spec (the DisplaySet class, the model and the pickled query), handed to a
+runner, written to default_storage in chunks and picked up by the user from
+the export_status view once it is done. Jobs are known by a random token and
+only the user who asked for one (or a superuser) can see it.
+
+ThreadExportRunner works inside the web process with no extra services and
+keeps job state in the cache. DatabaseExportRunner stores jobs in the
+ExportJob table for `manage.py run_export_jobs` to process.
+"""
+import base64
+import tempfile
+import threading
+import uuid
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import get_model
+from django.db.models.query import QuerySet
+from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.utils import simplejson
+from django.utils.importlib import import_module
+
+EXPORT_DIRECTORY = 'displayset_exports'
+
+def serialize_export(modeladmin, queryset, format='csv', pks=None):
+	"""
+	Returns a picklable description of exporting queryset, or just the rows
+	of it with pks, through modeladmin.
+	"""
+	opts = queryset.model._meta
+	return {
+		'format': format,
+		'pks': pks,
+		'displayset': '%s.%s' % (modeladmin.__class__.__module__, modeladmin.__class__.__name__),
+		'model': (opts.app_label, opts.object_name),
+		'query': pickle.dumps(queryset.query, pickle.HIGHEST_PROTOCOL),
+		'using': queryset.db,
+		'export_name': getattr(modeladmin, 'export_name', None) or opts.verbose_name,
+	}
+
+def load_export(spec):
+	"Rebuilds the DisplaySet and queryset described by serialize_export."
+	from django_displayset.views import DefaultDisplaySite
+	model = get_model(*spec['model'])
+	queryset = QuerySet(model=model, query=pickle.loads(spec['query']), using=spec['using'])
+	module, name = spec['displayset'].rsplit('.', 1)
+	display = getattr(import_module(module), name)(queryset, DefaultDisplaySite)
+	return display, queryset
+
+def run_export(job_id, spec, report):
+	"""
+	Writes the export described by spec to default_storage, calling report
+	with the job's progress as it goes.
+	"""
+	from django_displayset.exporters import EXPORTERS
+	exporter = EXPORTERS[spec.get('format', 'csv')]
+	display, queryset = load_export(spec)
+	pks = spec.get('pks')
+	batches = None
+	if pks is None:
+		total = display.get_count_strategy()(queryset)
+	else:
+		size = display.action_batch_size
+		batches = [pks[i:i+size] for i in range(0, len(pks), size)]
+		total = len(pks)
+	report(job_id, status='running', rows=0, total=total)
+
+	def progress(rows):
+		report(job_id, rows=rows)
+
+	output = tempfile.TemporaryFile()
+	try:
+		for chunk in exporter.stream(display, queryset, progress, batches):
+			output.write(chunk)
+		content = File(output)
+		content.size = output.tell() # a temporary file has no name to take the size from
+		output.seek(0)
+		# a directory nobody can guess, as storage is often served publicly
+		name = default_storage.save('%s/%s/%s.%s' % (EXPORT_DIRECTORY, uuid.uuid4().hex, spec['export_name'],
+			exporter.extension), content)
+	finally:
+		output.close()
+	report(job_id, status='done', file=name)
+
+def user_id(user):
+	"The pk of user, None for anonymous users."
+	if user is None or not user.is_authenticated():
+		return None
+	return user.pk
+
+def can_see(user, state):
+	"True if user may see the job with state: its owner or a superuser."
+	owner = state.get('user')
+	return owner is None or owner == user_id(user) or (user is not None and user.is_superuser)
+
+def job_status(state):
+	"The public view of a job's state."
+	status = {
+		'status': state.get('status', 'pending'),
+		'rows': state.get('rows', 0),
+		'total': state.get('total'),
+		'url': None,
+		'error': state.get('error', ''),
+	}
+	if state.get('file'):
+		status['url'] = default_storage.url(state['file'])
+	return status
+
+class ThreadExportRunner(object):
+	"""
+	Runs exports on a pool of worker threads in this process. Job state lives
+	in the cache, so status is only visible to other processes when they share
+	a cache backend.
+	"""
+	timeout = 60 * 60 * 24
+
+	def __init__(self, workers=2):
+		self.workers = workers
+		self.queue = queue.Queue()
+		self.lock = threading.Lock()
+		self.threads = []
+
+	def key(self, job_id):
+		return 'displayset.export.%s' % job_id
+
+	def report(self, job_id, **state):
+		current = cache.get(self.key(job_id)) or {}
+		current.update(state)
+		cache.set(self.key(job_id), current, self.timeout)
+
+	def start(self):
+		self.lock.acquire()
+		try:
+			while len(self.threads) < self.workers:
+				thread = threading.Thread(target=self.work)
+				thread.setDaemon(True)
+				thread.start()
+				self.threads.append(thread)
+		finally:
+			self.lock.release()
+
+	def work(self):
+		while True:
+			job_id, spec = self.queue.get()
+			try:
+				try:
+					run_export(job_id, spec, self.report)
+				except Exception as e:
+					self.report(job_id, status='failed', error=unicode(e))
+			finally:
+				connection.close()
+
+	def submit(self, spec, user=None):
+		job_id = uuid.uuid4().hex
+		self.report(job_id, status='pending', user=user_id(user))
+		self.start()
+		self.queue.put((job_id, spec))
+		return job_id
+
+	def state(self, job_id):
+		return cache.get(self.key(job_id))
+
+class DatabaseExportRunner(object):
+	"""
+	Queues exports in the ExportJob table; `manage.py run_export_jobs` (from
+	cron or a supervisor) runs them. Needs django_displayset in INSTALLED_APPS.
+	"""
+	def report(self, job_id, **state):
+		from django_displayset.models import ExportJob
+		ExportJob.objects.filter(pk=job_id).update(**state)
+
+	def submit(self, spec, user=None):
+		from django_displayset.models import ExportJob
+		job = ExportJob.objects.create(spec=base64.b64encode(pickle.dumps(spec, pickle.HIGHEST_PROTOCOL)),
+			user_id=user_id(user))
+		return job.token
+
+	def run_pending(self):
+		"Runs every pending job, returning how many were run."
+		from django_displayset.models import ExportJob
+		ran = 0
+		for job in ExportJob.objects.filter(status='pending').order_by('pk'):
+			# claim the job so a second worker doesn't run it too
+			if not ExportJob.objects.filter(pk=job.pk, status='pending').update(status='running'):
+				continue
+			try:
+				run_export(job.pk, pickle.loads(base64.b64decode(job.spec)), self.report)
+			except Exception as e:
+				self.report(job.pk, status='failed', error=unicode(e))
+			ran += 1
+		return ran
+
+	def state(self, job_id):
+		from django_displayset.models import ExportJob
+		try:
+			job = ExportJob.objects.get(token=job_id)
+		except ExportJob.DoesNotExist:
+			return None
+		return {'status': job.status, 'rows': job.rows, 'total': job.total,
+			'file': job.file, 'error': job.error, 'user': job.user_id}
+
+thread_runner = ThreadExportRunner()
+database_runner = DatabaseExportRunner()
+
+def get_export_runner(runner):
+	if runner == 'thread':
+		return thread_runner
+	elif runner == 'database':
+		return database_runner
+	return runner
+
+def export_status(request, job_id, runner='thread'):
+	"""
+	Redirects to the finished export, or answers with the job's progress as
+	JSON while it's still running. Other users' jobs are a 404.
+	"""
+	state = get_export_runner(runner).state(job_id)
+	if state is None or not can_see(getattr(request, 'user', None), state):
+		raise Http404
+	status = job_status(state)
+	if status['url'] and 'json' not in request.GET:
+		return HttpResponseRedirect(status['url'])
+	return HttpResponse(simplejson.dumps(status), mimetype='application/json')
@@ -0,0 +1,96 @@
+"""
+JSON mode for DisplaySets.
+
+DisplaySet.json_view answers with the same page changelist_view would show
+-- same search, ordering, filters and pagination -- as JSON, so a front-end
+can page through a report without the admin template:
+
+	{"header": ["Name", "City"],
+	 "rows": [["Smith", "Boston"], ...],
+	 "count": 120, "full_count": 4000, "page": 0, "pages": 2,
+	 "next": "?p=1", "previous": null, "aggregates": null}
+
+aggregates is the list_aggregates row, lined up with header, when there
+are any.
+
+Responses carry an ETag, and a Last-Modified when the DisplaySet names a
+last_modified_field, so clients revalidating an unchanged page get a 304.
+"""
+import time
+
+try:
+	from hashlib import md5
+except ImportError:
+	from md5 import new as md5
+
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import simplejson
+from django.utils.encoding import force_unicode
+from django.utils.http import http_date
+
+from django_displayset.columns import get_column_plan
+from django_displayset.exporters import cell_value
+
+def last_modified(display, cl):
+	"The Last-Modified date of cl's results, from display.last_modified_field, or None."
+	field = getattr(display, 'last_modified_field', None)
+	if not field:
+		return None
+	value = cl.query_set.aggregate(last_modified=Max(field))['last_modified']
+	if value is None:
+		return None
+	return http_date(time.mktime(value.timetuple()))
+
+def page_links(cl):
+	"The query strings of the next and previous pages, or None."
+	if getattr(cl, 'keyset', False):
+		return cl.keyset_next, cl.keyset_previous
+	if not cl.multi_page or cl.show_all:
+		return None, None
+	next = previous = None
+	if cl.page_num + 1 < cl.paginator.num_pages:
+		next = cl.get_query_string({PAGE_VAR: cl.page_num + 1})
+	if cl.page_num > 0:
+		previous = cl.get_query_string({PAGE_VAR: cl.page_num - 1})
+	return next, previous
+
+def page_data(display, cl):
+	plan = get_column_plan(display)
+	next, previous = page_links(cl)
+	pages = None
+	if cl.paginator is not None:
+		pages = cl.paginator.num_pages
+	aggregates = cl.aggregate_row
+	if aggregates is not None:
+		aggregates = [cell_value(v) for v in aggregates]
+	return {
+		'header': [force_unicode(h) for h in plan.header],
+		'rows': [[cell_value(v) for v in row] for row in plan.rows(cl.result_list)],
+		'count': cl.result_count,
+		'full_count': cl.full_result_count,
+		'page': cl.page_num,
+		'pages': pages,
+		'next': next,
+		'previous': previous,
+		'aggregates': aggregates,
+	}
+
+def json_response(display, request, cl):
+	modified = last_modified(display, cl)
+	if (modified and 'HTTP_IF_NONE_MATCH' not in request.META and
+			request.META.get('HTTP_IF_MODIFIED_SINCE') == modified):
+		return HttpResponseNotModified()
+
+	content = simplejson.dumps(page_data(display, cl), cls=DjangoJSONEncoder, separators=(',', ':'))
+	etag = '"%s"' % md5(content).hexdigest()
+	if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+		return HttpResponseNotModified()
+
+	response = HttpResponse(content, mimetype='application/json')
+	response['ETag'] = etag
+	if modified:
+		response['Last-Modified'] = modified
+	return response
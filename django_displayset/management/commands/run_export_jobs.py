@@ -0,0 +1,11 @@
+from django.core.management.base import NoArgsCommand
+
+from django_displayset.jobs import database_runner
+
+class Command(NoArgsCommand):
+	help = "Runs the pending background exports queued by DatabaseExportRunner."
+
+	def handle_noargs(self, **options):
+		ran = database_runner.run_pending()
+		if int(options.get('verbosity', 1)) > 0:
+			print("Ran %d export job(s)." % ran)
@@ -0,0 +1,29 @@
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import models
+
+def new_token():
+	return uuid.uuid4().hex
+
+class ExportJob(models.Model):
+	"A background export queued by jobs.DatabaseExportRunner."
+	STATUS_CHOICES = (
+		('pending', 'Pending'),
+		('running', 'Running'),
+		('done', 'Done'),
+		('failed', 'Failed'),
+	)
+	token = models.CharField(max_length=32, unique=True, default=new_token) # what export_status is asked for
+	user = models.ForeignKey(User, null=True, blank=True)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+	spec = models.TextField()
+	rows = models.PositiveIntegerField(default=0)
+	total = models.PositiveIntegerField(null=True, blank=True)
+	file = models.CharField(max_length=255, blank=True)
+	error = models.TextField(blank=True)
+	created = models.DateTimeField(auto_now_add=True)
+	updated = models.DateTimeField(auto_now=True)
+
+	def __unicode__(self):
+		return u'Export %s (%s)' % (self.pk, self.status)
@@ -0,0 +1,103 @@
+"""
+Rendered-page cache for DisplaySet changelists.
+
+Pages are stored in the Django cache under a key made from the DisplaySet,
+the query its queryset runs, the request's query string (search, sort, page
+and filters), the user, whose name the page shows, and their permissions, and
+a per-model version token. Bumping the version with invalidate() drops every
+cached page for that model at once. Querysets that can't match anything
+have no query to key on and aren't cached.
+"""
+import time
+
+try:
+	from hashlib import md5
+except ImportError:
+	from md5 import new as md5
+
+from django.core.cache import cache
+from django.db.models import signals
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.encoding import smart_str
+
+from django_displayset.counts import queryset_cache_key
+
+CSRF_PLACEHOLDER = '__displayset_csrf_token__'
+
+def version_key(model):
+	return 'displayset.page.version.%s.%s' % (model._meta.app_label, model._meta.object_name.lower())
+
+def get_version(model):
+	version = cache.get(version_key(model))
+	if version is None:
+		version = int(time.time() * 1000)
+		cache.add(version_key(model), version)
+	return version
+
+def invalidate(model):
+	"Drops every cached page showing model."
+	cache.set(version_key(model), int(time.time() * 1000))
+
+def invalidate_handler(sender, **kwargs):
+	invalidate(sender)
+
+def invalidate_on_save(model):
+	"Invalidates the cached pages of model whenever one of its rows is saved or deleted."
+	uid = version_key(model)
+	signals.post_save.connect(invalidate_handler, sender=model, dispatch_uid=uid + '.save')
+	signals.post_delete.connect(invalidate_handler, sender=model, dispatch_uid=uid + '.delete')
+
+def page_key(displayset, request):
+	"The cache key of the page, or None when it can't be cached."
+	queryset_key = queryset_cache_key(displayset.filtered_queryset, 'q')
+	if queryset_key is None:
+		return None
+	user = request.user
+	if user.is_superuser:
+		permissions = ['*']
+	else:
+		permissions = sorted(user.get_all_permissions())
+	parts = [
+		displayset.__class__.__module__,
+		displayset.__class__.__name__,
+		queryset_key,
+		repr(sorted(request.GET.lists())),
+		str(user.pk),
+		repr(permissions),
+		str(get_version(displayset.model)),
+	]
+	return 'displayset.page.%s' % md5(smart_str('|'.join(parts))).hexdigest()
+
+def get_page(displayset, request):
+	key = displayset.get_page_cache_key(request)
+	if key is None:
+		return None
+	cached = cache.get(key)
+	if cached is None:
+		return None
+	content, content_type = cached
+	# the page was stored without the token of whoever rendered it; without
+	# CsrfViewMiddleware there's no token to put back
+	return HttpResponse(content.replace(CSRF_PLACEHOLDER, get_token(request) or ''), content_type=content_type)
+
+def has_pending_messages(request):
+	storage = getattr(request, '_messages', None)
+	return bool(storage is not None and len(storage))
+
+def set_page(displayset, request, response):
+	"""
+	Stores a rendered changelist, unless it isn't a plain 200 page or it shows
+	messages meant for this user only.
+	"""
+	if response.status_code != 200 or has_pending_messages(request):
+		return
+	key = displayset.get_page_cache_key(request)
+	if key is None:
+		return
+	content = response.content
+	token = get_token(request)
+	if token:
+		content = content.replace(token, CSRF_PLACEHOLDER)
+	cache.set(key, (content, response['Content-Type']),
+		displayset.page_cache_timeout)
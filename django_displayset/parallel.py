@@ -0,0 +1,74 @@
+"""
+Parallel csv exports.
+
+The export's pks are split into chunks of export_worker_chunk_size, in
+report order. Each chunk is fetched, export_chunk_size pks per query, and
+formatted by a worker process with its own database connection, and the
+formatted chunks are yielded back in order, so rows come out in the same
+order as from csv_stream. Workers rebuild the DisplaySet and queryset once,
+when they start, rather than for every chunk.
+
+A worker chunk is a task handed to a process, so it should be large enough
+that formatting it outweighs sending it back: thousands of rows, not
+hundreds. Only processes on separate CPUs run at once; on a single CPU a
+pool is slower than csv_stream.
+"""
+import csv
+import multiprocessing
+
+from django.db import connections
+
+from django_displayset.columns import get_column_plan
+from django_displayset.jobs import serialize_export, load_export
+from django_displayset.exporters import EchoBuffer, csv_row, fast_rows, selection
+
+# The (display, queryset) of the export this worker process formats
+worker_export = None
+
+def init_worker(spec):
+	global worker_export
+	# The forked connection is the parent's; drop it without closing it so
+	# this process opens its own.
+	for connection in connections.all():
+		connection.connection = None
+	worker_export = load_export(spec)
+
+def format_chunk(pks):
+	display, queryset = worker_export
+	plan = get_column_plan(display)
+	query_size = getattr(display, 'export_chunk_size', None) or 500
+	rows = {}
+	for i in range(0, len(pks), query_size):
+		part = queryset.filter(pk__in=pks[i:i+query_size])
+		if fast_rows(display) and plan.values_fields:
+			rows.update([(row[0], row[1:]) for row in part.values_list('pk', *plan.values_fields)])
+		else:
+			planned = plan.query_plan.apply(part, display.after_pagination_select_related)
+			rows.update([(obj.pk, plan.row(obj)) for obj in planned])
+	writer = csv.writer(EchoBuffer())
+	return ''.join([writer.writerow(csv_row(rows[pk])) for pk in pks if pk in rows])
+
+def parallel_csv_stream(modeladmin, queryset, processes, progress=None, batches=None):
+	"Yields the same csv as csv_stream, formatted by a pool of processes."
+	spec = serialize_export(modeladmin, queryset)
+	chunk_size = getattr(modeladmin, 'export_worker_chunk_size', None) or 10000
+	display = load_export(spec)[0]
+	writer = csv.writer(EchoBuffer())
+	yield writer.writerow(csv_row(get_column_plan(display).header))
+
+	pks = []
+	for part in selection(queryset, batches):
+		pks.extend(part.values_list('pk', flat=True))
+	chunks = [pks[i:i+chunk_size] for i in range(0, len(pks), chunk_size)]
+	pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(spec,))
+	try:
+		written = 0
+		for i, text in enumerate(pool.imap(format_chunk, chunks)):
+			yield text
+			written += len(chunks[i])
+			if progress:
+				progress(written)
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
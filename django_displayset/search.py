@@ -0,0 +1,198 @@
+"""
+Search backends for DisplayList.
+
+A backend's search(queryset, search_fields, query) narrows queryset to the
+rows matching query. search_fields keep the admin's prefixes: '^' starts with,
+'=' exact, '@' full-text and no prefix contains.
+"""
+import operator
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+
+word_re = re.compile(r'\w+', re.UNICODE)
+
+def split_prefix(field_name):
+	if field_name[:1] in ('^', '=', '@'):
+		return field_name[0], field_name[1:]
+	return '', field_name
+
+def lookup_spawns_duplicates(opts, path):
+	"True if following path from opts crosses a reverse or many-to-many relation."
+	for name in path.split('__'):
+		try:
+			field, model, direct, m2m = opts.get_field_by_name(name)
+		except FieldDoesNotExist:
+			return False
+		if m2m or not direct:
+			return True
+		if not getattr(field, 'rel', None):
+			return False
+		opts = field.rel.to._meta
+	return False
+
+class ORMSearch(object):
+	"""
+	The admin's search: for each word an OR of field lookups, words ANDed
+	together.
+
+	Fields across reverse or many-to-many relations would repeat rows when
+	joined, so they are searched in a pk__in subquery and the outer query
+	never needs DISTINCT. Fields listed in distinct_fields keep the old join
+	plus DISTINCT.
+	"""
+	lookups = {'^': 'istartswith', '=': 'iexact', '@': 'search', '': 'icontains'}
+	distinct_fields = ()
+
+	def __init__(self, distinct_fields=()):
+		self.distinct_fields = distinct_fields
+
+	def construct_search(self, field_name):
+		prefix, name = split_prefix(field_name)
+		return "%s__%s" % (name, self.lookups[prefix])
+
+	def split_fields(self, opts, search_fields):
+		"Returns (joined, subqueried, distinct) for search_fields."
+		joined = []
+		subqueried = []
+		distinct = False
+		for field_name in search_fields:
+			if lookup_spawns_duplicates(opts, split_prefix(field_name)[1]):
+				if field_name in self.distinct_fields:
+					distinct = True
+				else:
+					subqueried.append(field_name)
+					continue
+			joined.append(field_name)
+		return joined, subqueried, distinct
+
+	def word_query(self, model, joined, subqueried, bit):
+		"The Q matching bit in any of the fields."
+		or_queries = [Q(**{self.construct_search(str(field_name)): bit}) for field_name in joined]
+		if subqueried:
+			related = [Q(**{self.construct_search(str(field_name)): bit}) for field_name in subqueried]
+			matches = model._base_manager.filter(reduce(operator.or_, related))
+			or_queries.append(Q(pk__in=matches.values('pk')))
+		return reduce(operator.or_, or_queries)
+
+	def search(self, queryset, search_fields, query):
+		joined, subqueried, distinct = self.split_fields(queryset.model._meta, search_fields)
+		for bit in query.split():
+			queryset = queryset.filter(self.word_query(queryset.model, joined, subqueried, bit))
+		if distinct:
+			return queryset.distinct()
+		return queryset
+
+class PrefixSearch(ORMSearch):
+	"""
+	Unprefixed fields match from the start of the value, LIKE 'word%', which a
+	b-tree index on UPPER(column) can serve. For substring matches on
+	PostgreSQL, plain ORMSearch over pg_trgm GIN indexes is the trigram option.
+	"""
+	lookups = ORMSearch.lookups.copy()
+	lookups[''] = 'istartswith'
+
+class FullTextSearch(ORMSearch):
+	"""
+	Base for database full-text backends. The model's own fields are matched
+	against a full-text index in a subquery, '^' fields by prefix. '=' fields
+	and fields across relations go through the ORM lookups. As in the admin,
+	each word has to match one of the fields and all the words have to match.
+	"""
+	def matches(self, model, fields, words, prefixed):
+		"""
+		Returns a values('pk') queryset of the rows where each of words
+		matches one of fields, by prefix for the fields in prefixed.
+		"""
+		raise NotImplementedError
+
+	def search(self, queryset, search_fields, query):
+		words = word_re.findall(query)
+		if not words:
+			return queryset
+		indexed = []
+		prefixed = []
+		other = []
+		for field_name in search_fields:
+			prefix, name = split_prefix(field_name)
+			if prefix == '=' or '__' in name:
+				other.append(field_name)
+			else:
+				indexed.append(name)
+				if prefix == '^':
+					prefixed.append(name)
+		if not indexed:
+			return super(FullTextSearch,self).search(queryset, search_fields, query)
+
+		model = queryset.model
+		joined, subqueried, distinct = self.split_fields(model._meta, other)
+		for word in words:
+			match = Q(pk__in=self.matches(model, indexed, [word], prefixed))
+			if other:
+				match = match | self.word_query(model, joined, subqueried, word)
+			queryset = queryset.filter(match)
+		if distinct:
+			return queryset.distinct()
+		return queryset
+
+class PostgresFullTextSearch(FullTextSearch):
+	"""
+	PostgreSQL tsvector search. Give vector_column to use a maintained tsvector
+	column, otherwise the vector is computed over the fields and needs a
+	matching expression index to be fast. '^' fields are always matched
+	against a vector of their own.
+	"""
+	def __init__(self, config='simple', vector_column=None):
+		self.config = config
+		self.vector_column = vector_column
+
+	def vector(self, model, fields, params):
+		qn = connection.ops.quote_name
+		table = qn(model._meta.db_table)
+		columns = ["coalesce(%s.%s::text, '')" % (table, qn(model._meta.get_field(name).column)) for name in fields]
+		params.append(self.config)
+		return "to_tsvector(%%s::regconfig, %s)" % " || ' ' || ".join(columns)
+
+	def matches(self, model, fields, words, prefixed):
+		qn = connection.ops.quote_name
+		plain = [name for name in fields if name not in prefixed]
+		starts = [name for name in fields if name in prefixed]
+		conditions = []
+		params = []
+		for group, suffix in ((plain, ''), (starts, ':*')):
+			if not group:
+				continue
+			if self.vector_column and not suffix:
+				vector = '%s.%s' % (qn(model._meta.db_table), qn(self.vector_column))
+			else:
+				vector = self.vector(model, group, params)
+			params.extend([self.config, ' & '.join([w + suffix for w in words])])
+			conditions.append('%s @@ to_tsquery(%%s::regconfig, %%s)' % vector)
+		where = '(%s)' % ' OR '.join(conditions)
+		return model._base_manager.extra(where=[where], params=params).values('pk')
+
+class SQLiteFTSSearch(FullTextSearch):
+	"""
+	SQLite FTS5 search, meant for local testing. table is an FTS5 table whose
+	rowid is the model's pk and whose columns are named like the model's, kept
+	in sync by the project, e.g.
+	CREATE VIRTUAL TABLE customer_fts USING fts5(first_name, last_name)
+	"""
+	def __init__(self, table):
+		self.table = table
+
+	def matches(self, model, fields, words, prefixed):
+		qn = connection.ops.quote_name
+		opts = model._meta
+		groups = []
+		for group, suffix in (([name for name in fields if name not in prefixed], ''),
+				([name for name in fields if name in prefixed], '*')):
+			if group:
+				groups.append(('{%s}' % ' '.join([opts.get_field(name).column for name in group]), suffix))
+		terms = ' AND '.join(['(%s)' % ' OR '.join(['%s : "%s"%s' % (columns, w.replace('"', '""'), suffix)
+			for columns, suffix in groups]) for w in words])
+		where = '%s.%s IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (
+			qn(opts.db_table), qn(opts.pk.column), qn(self.table), qn(self.table))
+		return model._base_manager.extra(where=[where], params=[terms]).values('pk')
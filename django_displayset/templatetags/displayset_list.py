@@ -0,0 +1,138 @@
+from django import template
+from django.contrib.admin.templatetags.admin_list import _boolean_icon, result_headers, result_hidden_fields
+from django.contrib.admin.util import display_for_field
+from django.contrib.admin.views.main import EMPTY_CHANGELIST_VALUE
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.utils.encoding import force_unicode, smart_unicode
+from django.utils.html import conditional_escape, escape
+from django.utils.safestring import mark_safe
+
+from django_displayset.columns import get_column_plan, model_field
+
+register = template.Library()
+
+def cell_renderer(cl, name, field):
+	"""
+	Renders the cells of column name the way the admin's items_for_result
+	does, with its lookup_field branching done once for the column instead
+	of for every cell. Returns a function of a result giving the cell's
+	class attribute and its html.
+	"""
+	row_class = ''
+	if field is not None:
+		if isinstance(field, (models.DateField, models.TimeField, models.ForeignKey)):
+			row_class = ' class="nowrap"'
+		if isinstance(field.rel, models.ManyToOneRel):
+			def value(obj):
+				field_val = getattr(obj, field.name)
+				if field_val is None:
+					return EMPTY_CHANGELIST_VALUE
+				return escape(field_val)
+		else:
+			def value(obj):
+				return display_for_field(getattr(obj, field.name), field)
+	else:
+		if name == u'action_checkbox':
+			row_class = ' class="action-checkbox"'
+		if callable(name):
+			attr = get = name
+		elif hasattr(cl.model_admin, name) and name not in ('__str__', '__unicode__'):
+			attr = get = getattr(cl.model_admin, name)
+		else:
+			attr = getattr(cl.model, name, None)
+			def get(obj):
+				value = getattr(obj, name)
+				if callable(value):
+					return value()
+				return value
+		if getattr(attr, 'boolean', False):
+			def value(obj):
+				return _boolean_icon(get(obj))
+		elif getattr(attr, 'allow_tags', False):
+			def value(obj):
+				return mark_safe(smart_unicode(get(obj)))
+		else:
+			def value(obj):
+				return escape(smart_unicode(get(obj)))
+
+	def render(obj):
+		try:
+			result_repr = value(obj)
+		except (AttributeError, ObjectDoesNotExist):
+			return '', EMPTY_CHANGELIST_VALUE
+		if force_unicode(result_repr) == '':
+			result_repr = mark_safe('&nbsp;')
+		return row_class, result_repr
+	return render
+
+def cell_renderers(cl):
+	"A (name, renderer) pair for each column of cl, from its DisplaySet's column plan."
+	model_fields = get_column_plan(cl.model_admin).model_fields
+	renderers = []
+	for name in cl.list_display:
+		if name in model_fields:
+			field = model_fields[name]
+		else:
+			field = model_field(cl.lookup_opts, name)
+		renderers.append((name, cell_renderer(cl, name, field)))
+	return renderers
+
+def items_for_result(cl, result, form, renderers):
+	"The admin's items_for_result, running the precompiled renderers."
+	first = True
+	pk = cl.lookup_opts.pk.attname
+	for field_name, render in renderers:
+		row_class, result_repr = render(result)
+		# If list_display_links not defined, add the link tag to the first field
+		if (first and not cl.list_display_links) or field_name in cl.list_display_links:
+			table_tag = {True:'th', False:'td'}[first]
+			first = False
+			url = cl.url_for_result(result)
+			if cl.to_field:
+				attr = str(cl.to_field)
+			else:
+				attr = pk
+			value = result.serializable_value(attr)
+			result_id = repr(force_unicode(value))[1:]
+			yield mark_safe(u'<%s%s><a href="%s"%s>%s</a></%s>' % \
+				(table_tag, row_class, url, (cl.is_popup and ' onclick="opener.dismissRelatedLookupPopup(window, %s); return false;"' % result_id or ''), conditional_escape(result_repr), table_tag))
+		else:
+			if (form and field_name in form.fields and not (
+					field_name == cl.model._meta.pk.name and
+						form[cl.model._meta.pk.name].is_hidden)):
+				bf = form[field_name]
+				result_repr = mark_safe(force_unicode(bf.errors) + force_unicode(bf))
+			else:
+				result_repr = conditional_escape(result_repr)
+			yield mark_safe(u'<td%s>%s</td>' % (row_class, result_repr))
+	if form and not form[cl.model._meta.pk.name].is_hidden:
+		yield mark_safe(u'<td>%s</td>' % force_unicode(form[cl.model._meta.pk.name]))
+
+class ResultList(list):
+	# carries the row's form for the template's error reporting, like the admin's
+	def __init__(self, form, *items):
+		self.form = form
+		super(ResultList, self).__init__(*items)
+
+def results(cl):
+	renderers = cell_renderers(cl)
+	if cl.formset:
+		for res, form in zip(cl.result_list, cl.formset.forms):
+			yield ResultList(form, items_for_result(cl, res, form, renderers))
+	else:
+		for res in cl.result_list:
+			yield ResultList(None, items_for_result(cl, res, None, renderers))
+
+def displayset_result_list(cl):
+	"""
+	The admin's result_list, with the rows rendered from the DisplaySet's
+	column plan and a <tfoot> row of cl.aggregate_row under the columns
+	when the DisplaySet has list_aggregates.
+	"""
+	return {'cl': cl,
+		'result_hidden_fields': list(result_hidden_fields(cl)),
+		'result_headers': list(result_headers(cl)),
+		'results': list(results(cl)),
+		'aggregate_row': cl.aggregate_row}
+displayset_result_list = register.inclusion_tag("displayset/change_list_results.html")(displayset_result_list)
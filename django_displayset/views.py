@@ -1,21 +1,37 @@
-import operator
-import csv
+import base64
+import datetime
+import decimal
+import re
 
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.contrib.admin.views.main import ChangeList
 from django.contrib.admin import options as adminoptions
 from django.core.paginator import Paginator, InvalidPage
-from django.http import HttpResponseRedirect,HttpResponse
+from django.http import HttpResponseRedirect,HttpResponse,HttpResponseBadRequest
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.utils.http import urlencode
 from django.utils.translation import ungettext
 from django.utils.encoding import force_unicode
 from django.db.models import Q
+from django.db.models.query import QuerySet
 from django.db import models
+from django.utils import simplejson
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.admin import helpers
 from django import template
 
+from django_displayset import aggregates
+from django_displayset.bulkedit import save_changed_forms, saves_are_plain
+from django_displayset.columns import get_column_plan, concrete_field
+from django_displayset.counts import ExactCount, CachedCount, EstimatedCount, count_pool, is_cheap
+from django_displayset.instrumentation import get_timings
+from django_displayset.search import ORMSearch, PrefixSearch
+from django_displayset import pagecache
+from django_displayset.jobs import get_export_runner, serialize_export
+from django_displayset.jsonview import json_response
+from django_displayset.exporters import EXPORTERS, csv_export
+
 def cap_first(string):
 	#This works exactly like string.title(), except it does not remove interior capitalization.
 	if string:
@@ -52,10 +68,93 @@ class DefaultDisplaySite(object):
 		no_wrap = csrf_protect(no_wrap)
 		return update_wrapper(no_wrap, view)
 
+range_part_re = re.compile(r'^(.+)_(\d+)$')
+
+def model_labels(model, pks):
+	"Returns {unicode(pk): unicode(obj)} for the given pks of model, in one query."
+	return dict([(unicode(o.pk), unicode(o)) for o in model._default_manager.filter(pk__in=pks)])
+
+def build_report_header(display, filter, params):
+	"""
+	Turns FilterSet parameters into (label, value) pairs for a report header.
+
+	ModelChoice values are resolved with one query per model rather than per
+	field, and the parts of a range field (date_0, date_1, ...) are joined
+	into one 'start - end' entry where the first part was. A
+	ParameterFilterSet supplies cached labels through resolve_labels and
+	choice_labels.
+	"""
+	form = filter.form
+	parameter_fields = getattr(display, 'parameter_fields', None) or {}
+	resolve_labels = getattr(filter, 'resolve_labels', model_labels)
+
+	# Gather the pks of every model choice parameter so each model is queried once
+	wanted = {}
+	for field, value in params:
+		if field not in parameter_fields and form and field in form.fields:
+			queryset = getattr(form.fields[field], 'queryset', None)
+			if queryset is not None:
+				wanted.setdefault(queryset.model, set()).update(value)
+	labels = dict([(model, resolve_labels(model, pks)) for model, pks in wanted.items()])
+
+	header = []
+	ranges = {}
+	for field, value in params:
+		new_value = value
+
+		if parameter_fields.get(field,None):
+			new_value = parameter_fields[field](form,field,value)
+		elif form and field in form.fields:
+			form_field = form.fields[field]
+			if getattr(form_field, 'queryset', None) is not None:
+				found = labels[form_field.queryset.model]
+				new_value = ', '.join([found[unicode(v)] for v in value if unicode(v) in found])
+			elif getattr(form_field,'choices', None):
+				if hasattr(filter, 'choice_labels'):
+					choices = filter.choice_labels(field)
+				else:
+					choices = dict([(unicode(k), unicode(label)) for k, label in form_field.choices])
+				new_value = ', '.join([choices[unicode(v)] for v in value if unicode(v) in choices])
+			else:
+				new_value = ', '.join(new_value)
+
+		if new_value is None:
+			continue
+
+		match = range_part_re.match(field)
+		if match:
+			# Hold a place for the whole range where its first part shows up
+			base = match.group(1)
+			if base not in ranges:
+				ranges[base] = (len(header), [])
+				header.append(None)
+			ranges[base][1].append((int(match.group(2)), field, new_value))
+		else:
+			header.append((pretty(field),new_value))
+
+	for base, (position, parts) in ranges.items():
+		if len(parts) == 1:
+			index, field, new_value = parts[0]
+			header[position] = (pretty(field), new_value)
+		else:
+			parts.sort()
+			values = []
+			for index, field, new_value in parts:
+				if isinstance(new_value, (list, tuple)):
+					new_value = ', '.join(new_value)
+				values.append(new_value)
+			header[position] = (pretty(base), ' - '.join(values))
+	return header
+
 def generic(request,queryset,display_class,extra_context=None,display_site=DefaultDisplaySite):
 	display = display_class(queryset,display_site)
 	return display.changelist_view(request,extra_context)
 
+def json_generic(request,queryset,display_class,display_site=DefaultDisplaySite):
+	"generic, answering with the page as JSON rather than the template."
+	display = display_class(queryset,display_site)
+	return display.json_view(request)
+
 def filterset_generic(request,filter,display_class,queryset=None,extra_context=None,display_site=DefaultDisplaySite):
 	"""
 	In this situation, we're using the FilterSet which has the convenience get_parameters()
@@ -63,59 +162,20 @@ def filterset_generic(request,filter,display_class,queryset=None,extra_context=N
 
 	It supplies extra context which can be used to create a table report_header in the template
 	"""
-	queryset = queryset or filter.qs
+	timings = get_timings(display_class)
+	with timings.phase('filter'):
+		if queryset is None:
+			queryset = filter.qs
 	extra_context = extra_context or {}
 	display = display_class(queryset,display_site)
+	display.timings = timings
 
-	if hasattr(filter,'get_parameters'):
-		params = filter.get_parameters()
-	else:
-		params =  []
-
-	form = filter.form
-
-	updated_params = []
-	for p in params:
-		field, value = p
-		new_value = value
-
-		if hasattr(display,"parameter_fields") and display.parameter_fields.get(field,None):
-			new_value = display.parameter_fields.get(field)(form,field,value)
-		elif form and field in form.fields:
-
-			if getattr(form.fields[field],'queryset',None):
-				new_value = ', '.join([unicode(o) for o in form.fields[field].queryset.filter(pk__in=value)])
-			elif getattr(form.fields[field],'choices', None):
-				new_value = ', '.join([unicode(c[1]) for c in form.fields[field].choices if unicode(c[0]) in value])
-			else:
-				new_value = ', '.join(new_value)
-
-		if new_value is not None:
-			updated_params.append((pretty(field),new_value))
-
-	if params:
-		#Here, we gather all the range fields and display them as one parameter
-		range_dict = {}
-		#First, compare the names to see which fields belong together
-		for i,p in enumerate(updated_params):
-			param_name = p[0][:-1]
-			for j in range(i+1,len(updated_params)-1):
-				param_name_check = updated_params[j][0][:-1]
-				if param_name == param_name_check:
-					if not range_dict.get(param_name,None):
-						range_dict[param_name] = [i]
-					if j not in range_dict[param_name]:
-						range_dict[param_name].append(j)
-		# Append the new range values to the updated_parameters
-		for field,values in range_dict.items():
-			field_name = field[:-1]
-			field_values = ' - '.join([updated_params[v][1][0] for v in values])
-			updated_params.append((field_name,field_values))
-		# Remove the old parameters from updated_parameters
-		remove_indices = []
-		[remove_indices.extend(v) for v in range_dict.values()]
-		for i, index in enumerate(sorted(remove_indices)):
-			del updated_params[index-i]
+	with timings.phase('report_header'):
+		if hasattr(filter,'get_parameters'):
+			params = filter.get_parameters()
+		else:
+			params =  []
+		updated_params = build_report_header(display, filter, params)
 
 	if updated_params:
 		if not extra_context.get('report_header'):
@@ -127,79 +187,107 @@ def filterset_generic(request,filter,display_class,queryset=None,extra_context=N
 
 	return display.changelist_view(request,extra_context)
 
-def list_replace(replacements, original): # replacements are [(index,function),(index,function),...]
-	for item in replacements: # item is (index, function)
-		original.pop(item[0])
-		original.insert(item[0],item[1])
-	return original
-
-# How to add csv export to your own display set
-# class DisplaySetSubclass(DisplaySet):
-#	export = True
-#	export_name = "display_report" ####makes the file name display_report.csv
-def csv_export(modeladmin, request, queryset):
-	import re
-	html_re = re.compile("<.*>(.*)</.*>")
-	response = HttpResponse(mimetype='text/csv')
-	try:
-		export_name = modeladmin.export_name
-	except AttributeError:
-		export_name = queryset.model._meta.verbose_name
-	finally:
-		response['Content-Disposition'] = 'attachment; filename=%s.csv' % export_name
-	writer = csv.writer(response)
-	fields = []
-	header = []
-	for f in modeladmin.list_display:
-		if f != 'action_checkbox':
-			if callable(f):
-				fields.append(f)
-				try:
-					header.append(f.short_description)
-				except AttributeError:
-					header.append(f.__name__)
-				continue
-			fields.append(f);header.append(f)
-	writer.writerow(header)
-	for obj in queryset:
-		row = []
-		for f in fields:
-			if f != 'action_checkbox':
-				if callable(f):
-					text = f(obj)
-					try:
-						text = html_re.search(text).groups()[0]
-						row.append(text)
-					except (TypeError,AttributeError): # either we got something like a datetime or no match was found (no html, so its clean)
-						row.append(text)
-					continue
-				try:
-					attr = getattr(obj, f)
-				except AttributeError:
-					attr = "(None)"
-				row.append(attr)
-		writer.writerow(row)
-	return response
-csv_export.short_description = "Export to Excel"
+def iterate_batches(queryset, batches=None):
+	"Yields the objects of queryset, or of each batch of pks of it, through iterator()."
+	if batches is None:
+		for obj in queryset.iterator():
+			yield obj
+		return
+	for batch in batches:
+		for obj in queryset.filter(pk__in=batch).iterator():
+			yield obj
+
+class DisplayPaginator(Paginator):
+	"A Paginator that gets its count from count_function rather than object_list.count()."
+	def __init__(self, object_list, per_page, count_function=None, **kwargs):
+		super(DisplayPaginator,self).__init__(object_list, per_page, **kwargs)
+		self.count_function = count_function
+
+	def _get_count(self):
+		if self._count is None and self.count_function is not None:
+			self._count = self.count_function(self.object_list)
+		return super(DisplayPaginator,self)._get_count()
+	count = property(_get_count)
 
 ORDER_VAR = 'o'
 ORDER_TYPE_VAR = 'ot'
 MAX_SHOW_ALL = 1000
+PAGE_VAR = 'p'
+KEYSET_VAR = 'k'
+
+def cursor_value(value):
+	"value in a form JSON carries without losing precision, see parse_cursor_value."
+	if isinstance(value, datetime.datetime):
+		return value.isoformat(' ')
+	if isinstance(value, (datetime.date, datetime.time)):
+		return value.isoformat()
+	if isinstance(value, decimal.Decimal):
+		return str(value)
+	return value
+
+def parse_cursor_value(opts, order_field, value):
+	"Turns a cursor_value back into what order_field holds."
+	field = concrete_field(opts, order_field)
+	if field is None or value is None:
+		return value
+	return field.to_python(value)
+
+def never_null(opts, path):
+	"""
+	True if path is a concrete field that can't be NULL, reached through
+	foreign keys that can't be either. Keyset cursors need such a field, as
+	NULLs can't be compared past and sort differently on each database.
+	"""
+	if concrete_field(opts, path) is None:
+		return False
+	for name in path.split('__'):
+		field = opts.get_field_by_name(name)[0]
+		if field.null:
+			return False
+		if getattr(field, 'rel', None):
+			opts = field.rel.to._meta
+	return True
+
+def encode_cursor(cursor):
+	return base64.urlsafe_b64encode(simplejson.dumps(cursor, cls=DjangoJSONEncoder))
+
+def decode_cursor(value):
+	if not value:
+		return None
+	try:
+		cursor = simplejson.loads(base64.urlsafe_b64decode(str(value)))
+	except (TypeError, ValueError):
+		return None
+	if not isinstance(cursor, list) or len(cursor) != 5:
+		return None
+	return cursor
+
+def lazy_result(name):
+	"A DisplayList attribute worked out by load_results on first use."
+	def get(self):
+		return self.load_results()[name]
+	return property(get)
+
 class DisplayList(ChangeList):
+	keyset = False
+	result_count = lazy_result('result_count')
+	full_result_count = lazy_result('full_result_count')
+	result_list = lazy_result('result_list')
+	can_show_all = lazy_result('can_show_all')
+	multi_page = lazy_result('multi_page')
+	paginator = lazy_result('paginator')
+	keyset_next = lazy_result('keyset_next')
+	keyset_previous = lazy_result('keyset_previous')
+	_aggregates = None
 
 	def __init__(self,request,*args,**kwargs):
-		super(DisplayList,self).__init__(request,*args,**kwargs)
+		# needed by get_query_string, which keyset pagination uses for its links
 		self.multiple_params_safe = dict(request.GET.lists())
-		self.model_admin.default_list_display = self.handle_default_display()
-		self.list_display = self.handle_list_display()
-		self.order_field, self.order_type = self.get_ordering()
-		self.query_set = self.get_query_set()
-		self.get_results(request)
-		if not self.model_admin.actions:
-			try:
-				self.list_display.remove('action_checkbox')
-			except ValueError:
-				pass
+		# a cursor only holds for the search and filters it was made with,
+		# so links and the search form start over from the first page
+		self.multiple_params_safe.pop(KEYSET_VAR, None)
+		super(DisplayList,self).__init__(request,*args,**kwargs)
+		self.params.pop(KEYSET_VAR, None)
 
 	def get_query_string(self, new_params=None, remove=None):
 		if new_params is None: new_params = {}
@@ -228,36 +316,71 @@ class DisplayList(ChangeList):
 		return '?%s' % urlencode(final_params)
 
 	def get_query_set(self):
+		qs = self.root_query_set
+
 		# Set ordering.
 		if self.order_field:
-			self.filtered_queryset = self.filtered_queryset.order_by('%s%s' % ((self.order_type == 'desc' and '-' or ''), self.order_field))
+			# a column's annotation has to be there before it can be sorted on
+			annotations = get_column_plan(self.model_admin).query_plan.missing_annotations(qs, [self.order_field])
+			if annotations:
+				qs = qs.annotate(**annotations)
+			qs = qs.order_by('%s%s' % ((self.order_type == 'desc' and '-' or ''), self.order_field))
 
 		# Apply keyword searches.
-		def construct_search(field_name):
-			if field_name.startswith('^'):
-				return "%s__istartswith" % field_name[1:]
-			elif field_name.startswith('='):
-				return "%s__iexact" % field_name[1:]
-			elif field_name.startswith('@'):
-				return "%s__search" % field_name[1:]
-			else:
-				return "%s__icontains" % field_name
-
 		if self.search_fields and self.query:
-			for bit in self.query.split():
-				or_queries = [Q(**{construct_search(str(field_name)): bit}) for field_name in self.search_fields]
-				self.filtered_queryset = self.filtered_queryset.filter(reduce(operator.or_, or_queries))
-			for field_name in self.search_fields:
-				if '__' in field_name:
-					self.filtered_queryset = self.filtered_queryset.distinct()
-					break
+			backend = self.model_admin.get_search_backend()
+			qs = backend.search(qs, self.search_fields, self.query)
 
-		return self.filtered_queryset
+		return qs
 
 	#<<<<
 
 	def get_results(self, request):
-		paginator = Paginator(self.query_set, self.list_per_page)
+		"""
+		Nothing is counted or fetched until result_count, result_list,
+		paginator or another result is first used, so requests that never
+		show the page, like actions and exports, don't pay for it.
+		"""
+		# keyset pages need a non-null sort column, other sorts page by offset
+		self.keyset = self.model_admin.pagination == 'keyset' and (not self.order_field or
+			self.order_field == self.lookup_opts.pk.name or never_null(self.lookup_opts, self.order_field))
+		self._results_request = request
+		self._results = None
+
+	def load_results(self):
+		if self._results is None:
+			if self.keyset:
+				self._results = self.get_keyset_results(self._results_request)
+			else:
+				self._results = self.get_page_results(self._results_request)
+		return self._results
+
+	def load_aggregates(self):
+		"The ({field: value}, count) of list_aggregates over the results."
+		if self._aggregates is None:
+			self._aggregates = self.model_admin.get_aggregates(self.query_set)
+		return self._aggregates
+
+	def get_aggregate_row(self):
+		"The list_aggregates under list_display's columns, for the footer."
+		if not self.model_admin.list_aggregates:
+			return None
+		return aggregates.aggregate_row(self.list_display, self.load_aggregates()[0])
+	aggregate_row = property(get_aggregate_row)
+
+	def get_page_results(self, request):
+		count_strategy = count_function = self.model_admin.get_count_strategy()
+		if self.model_admin.list_aggregates:
+			# the aggregate query counts the rows too
+			count_function = lambda queryset: self.load_aggregates()[1]
+		paginator = DisplayPaginator(self.query_set, self.list_per_page, count_function=count_function)
+		page = None
+		if self.model_admin.concurrent_count and not (self.show_all or self.list_editable):
+			# Fetch the page while the count runs on its own connection.
+			counter = count_pool.submit(count_function, self.query_set)
+			offset = self.page_num * self.list_per_page
+			page = list(self.apply_query_plan(self.query_set[offset:offset + self.list_per_page]))
+			paginator._count = counter.result()
 		# Get the number of objects, with admin filters applied.
 		result_count = paginator.count
 
@@ -267,20 +390,20 @@ class DisplayList(ChangeList):
 		# because we've already done paginator.hits and the value is cached.
 		if not self.query_set.query.where:
 			full_result_count = result_count
+		elif is_cheap(count_strategy, self.root_query_set):
+			full_result_count = count_strategy(self.root_query_set)
 		else:
-			#<<<<
-
-			#Temporary fix... we are going to patch this...
-			#The template has also been temp fixed to not show this number
-			full_result_count = -1#self.root_query_set.count()
-
-			#<<<
+			# An exact second COUNT(*) on every hit is too expensive, so the
+			# total is only shown with a cached or estimated count_strategy.
+			full_result_count = -1
 
 		can_show_all = MAX_SHOW_ALL #<<<<
 		multi_page = result_count > self.list_per_page
 
 		# Get the list of objects to display on this page.
-		if (self.show_all and can_show_all) or not multi_page:
+		if page is not None and (multi_page or self.page_num == 0):
+			result_list = page
+		elif (self.show_all and can_show_all) or not multi_page:
 			result_list = self.query_set._clone()
 		else:
 			try:
@@ -288,97 +411,363 @@ class DisplayList(ChangeList):
 			except InvalidPage:
 				result_list = ()
 
-		if getattr(self,"after_pagination_select_related",[]):
-			result_list = result_list.select_related(*self.after_pagination_select_related)
-
-		self.result_count = result_count
-		self.full_result_count = full_result_count
-		self.result_list = result_list
-		self.can_show_all = can_show_all
-		self.multi_page = multi_page
-		self.paginator = paginator
-
-	def handle_default_display(self):
-		replace_list = []
-		for x,f in enumerate(self.model_admin.default_list_display):
-			func = self.get_absolute_urlify(f)
-			if func:
-				replace_list.append((x,func))
-		return list_replace(replace_list,self.model_admin.default_list_display)
-
-	def handle_list_display(self):
-		replace_list = []
-		for x,f in enumerate(self.model_admin.list_display):
-			func = self.get_absolute_urlify(f)
-			if func:
-				replace_list.append((x,func))
-
-		self.model_admin.list_display = self.prepend_default_display()
-		return list_replace(replace_list,self.model_admin.list_display)
-
-	def prepend_default_display(self):
-		list_display = self.model_admin.list_display[:]
-		for f in reversed(self.model_admin.default_list_display):
-			if 'action_checkbox' in list_display:
-				list_display.insert(1,f) # action checkbox is in the first slot
-			else: list_display.insert(0,f)
-		return list_display
-
-	def get_absolute_urlify(self,field):
-		func = None
-		if field in self.model_admin.use_get_absolute_url:
-			func = lambda obj: "<a href='%s'>%s</a>" % (obj.get_absolute_url(), getattr(obj,func.field)) # or func.field
-			func.admin_order_field = field
-			func.short_description = field.replace('_',' ')
-		elif callable(field) and field.__name__ in self.model_admin.use_get_absolute_url:
-			func = lambda obj: "<a href='%s'>%s</a>" % (obj.get_absolute_url, func.field(obj)) # or func.field(obj)
-			try:
-				func.admin_order_field = field.admin_order_field
-			except AttributeError:
-				func.admin_order_field = None
+		if isinstance(result_list, QuerySet):
+			result_list = self.apply_query_plan(result_list)
+
+		return {
+			'result_count': result_count,
+			'full_result_count': full_result_count,
+			'result_list': result_list,
+			'can_show_all': can_show_all,
+			'multi_page': multi_page,
+			'paginator': paginator,
+			'keyset_next': None,
+			'keyset_previous': None,
+		}
+
+	def get_keyset_results(self, request):
+		"""
+		Seek pagination: rather than OFFSET/LIMIT and a COUNT(*), the page
+		is found by filtering past a cursor made of the sort column and pk,
+		which is carried in the query string. Every page costs the same as
+		the first. The sort column is a concrete, non-null field (see
+		get_results). A cursor that doesn't parse starts over.
+		"""
+		pk_name = self.lookup_opts.pk.name
+		order_field = self.order_field or pk_name
+		cursor = decode_cursor(request.GET.get(KEYSET_VAR))
+		if cursor and cursor[:2] != [order_field, self.order_type]:
+			cursor = None # the sort changed since the cursor was made
+		if cursor:
 			try:
-				func.short_description = field.short_description
-			except AttributeError:
-				func.short_description = field.__name__
-
-		if func:
-			func.allow_tags = True
-			func.field = field
-			return func
+				value = parse_cursor_value(self.lookup_opts, order_field, cursor[3])
+				pk = self.lookup_opts.pk.to_python(cursor[4])
+			except (ValidationError, ValueError, TypeError):
+				cursor = None
+			else:
+				if value is None or pk is None:
+					cursor = None
+		backwards = bool(cursor) and cursor[2] == 'prev'
+
+		# scan towards the cursor's side when paging backwards
+		descending = (self.order_type == 'desc') != backwards
+		sign = descending and '-' or ''
+		lookup = descending and 'lt' or 'gt'
+		if order_field == pk_name:
+			queryset = self.query_set.order_by(sign + pk_name)
+		else:
+			queryset = self.query_set.order_by(sign + order_field, sign + pk_name)
+		if cursor:
+			if order_field == pk_name:
+				queryset = queryset.filter(**{'pk__%s' % lookup: pk})
+			else:
+				queryset = queryset.filter(Q(**{'%s__%s' % (order_field, lookup): value}) |
+					Q(**{order_field: value, 'pk__%s' % lookup: pk}))
+		queryset = self.apply_query_plan(queryset)
+
+		result_list = list(queryset[:self.list_per_page + 1])
+		has_more = len(result_list) > self.list_per_page
+		result_list = result_list[:self.list_per_page]
+		if backwards:
+			result_list.reverse()
+
+		def cursor_link(obj, direction):
+			value = reduce(getattr, order_field.split('__'), obj)
+			cursor = encode_cursor([order_field, self.order_type, direction, cursor_value(value), obj.pk])
+			return self.get_query_string({KEYSET_VAR: cursor, PAGE_VAR: None})
+
+		keyset_next = keyset_previous = None
+		if result_list:
+			if has_more or backwards:
+				keyset_next = cursor_link(result_list[-1], 'next')
+			if cursor and (has_more or not backwards):
+				keyset_previous = cursor_link(result_list[0], 'prev')
+		elif cursor:
+			keyset_previous = self.get_query_string({KEYSET_VAR: None, PAGE_VAR: None})
+
+		return {
+			'result_count': len(result_list),
+			'full_result_count': -1,
+			'result_list': result_list,
+			'can_show_all': False,
+			'multi_page': bool(keyset_next or keyset_previous),
+			'paginator': None,
+			'keyset_next': keyset_next,
+			'keyset_previous': keyset_previous,
+		}
+
+	def apply_query_plan(self, queryset):
+		"""
+		Loads what the list_display columns depend on (see columns.py) along
+		with after_pagination_select_related, so a page costs a fixed number
+		of queries whatever its columns read.
+		"""
+		select_related = self.model_admin.after_pagination_select_related
+		plan = get_column_plan(self.model_admin)
+		queryset = plan.query_plan.apply(queryset, select_related)
+		if self.model_admin.fast_rows is not False and plan.only_fields and not self.list_editable:
+			# every column is a plain field: load just those
+			queryset = queryset.only(*(plan.only_fields + list(select_related)))
+		return queryset
+
+	def get_single_result(self):
+		"""
+		Returns the only object in the results, or None when there isn't
+		exactly one. This reuses the count and page load_results works out,
+		and the page it evaluates is the one the template renders, so no
+		extra query is run.
+		"""
+		if self.keyset:
+			if self.keyset_next or self.keyset_previous:
+				return None
+		elif self.result_count != 1:
+			return None
+		results = list(self.result_list)
+		if len(results) == 1:
+			return results[0]
 		return None
 
+def absolute_urlify(field, use_get_absolute_url):
+	"A column linking field to obj.get_absolute_url(), if it's in use_get_absolute_url."
+	func = None
+	if field in use_get_absolute_url:
+		func = lambda obj: "<a href='%s'>%s</a>" % (obj.get_absolute_url(), getattr(obj,func.field)) # or func.field
+		func.admin_order_field = field
+		func.short_description = field.replace('_',' ')
+	elif callable(field) and field.__name__ in use_get_absolute_url:
+		func = lambda obj: "<a href='%s'>%s</a>" % (obj.get_absolute_url, func.field(obj)) # or func.field(obj)
+		try:
+			func.admin_order_field = field.admin_order_field
+		except AttributeError:
+			func.admin_order_field = None
+		try:
+			func.short_description = field.short_description
+		except AttributeError:
+			func.short_description = field.__name__
+
+	if func:
+		func.allow_tags = True
+		func.field = field
+		for dependency in ('select_related', 'prefetch_related', 'annotations'):
+			if hasattr(field, dependency):
+				setattr(func, dependency, getattr(field, dependency))
+		return func
+	return None
+
+class DisplayConfig(object):
+	"""
+	The columns and export actions of a DisplaySet class, worked out once:
+	list_display with default_list_display in front and use_get_absolute_url
+	columns linked, and an action per export format. Both are tuples shared
+	by every request, so they're never changed after they're built.
+	"""
+	def __init__(self, display_class):
+		list_display = display_class.list_display
+		if list_display is not None:
+			list_display = list(list_display)
+			for f in reversed(display_class.default_list_display):
+				if 'action_checkbox' in list_display:
+					list_display.insert(1,f) # action checkbox is in the first slot
+				else: list_display.insert(0,f)
+			list_display = tuple([absolute_urlify(f, display_class.use_get_absolute_url) or f
+				for f in list_display])
+		self.list_display = list_display
+
+		export_actions = ()
+		if display_class.export:
+			export_actions = tuple([EXPORTERS[format].action for format in display_class.export_formats])
+		self.export_actions = export_actions
+
+_display_configs = {}
+
+def get_display_config(display_class):
+	"""
+	Returns the DisplayConfig of display_class, rebuilt only when the class
+	attributes it's made from change.
+	"""
+	key = (display_class.list_display and tuple(display_class.list_display),
+		tuple(display_class.default_list_display), tuple(display_class.use_get_absolute_url),
+		display_class.export, tuple(display_class.export_formats))
+	cached = _display_configs.get(display_class)
+	if cached is None or cached[0] != key:
+		cached = (key, DisplayConfig(display_class))
+		_display_configs[display_class] = cached
+	return cached[1]
+
 class DisplaySet(adminoptions.ModelAdmin):
 	#<<<<
 	change_list_template = 'displayset/base.html'
 	use_get_absolute_url = []
 	default_list_display = []
 	after_pagination_select_related = []
+	pagination = 'offset' # or 'keyset' for next/prev seek pagination without COUNT(*)
+	count_strategy = 'exact' # 'cached', 'estimated' or a strategy instance from counts.py
+	count_cache_timeout = 300
+	count_estimate_threshold = 100000
+	list_aggregates = {} # e.g. {'amount': Sum}, totals over the filtered results, see aggregates.py
+	concurrent_count = False # run the count beside the page query on a counts.count_pool worker; only pays for slow counts
+	search_backend = 'orm' # 'prefix' or a backend instance from search.py
+	search_distinct_fields = () # relation search_fields to join with DISTINCT instead of a subquery
+	page_cache = False # cache rendered GET pages, see pagecache.py
+	page_cache_timeout = 60
+	page_cache_invalidate_on_save = True
+	instrument = False # time each phase of changelist_view, see instrumentation.py
+	timings_context_name = None # e.g. 'timings' to hand them to the template
+	action_batch_size = 500 # selected pks per query for set_based and row_based actions
+	list_editable_bulk = None # True to batch list_editable saves, False for per-row save_model; see bulkedit.py
+	last_modified_field = None # e.g. 'updated', the Last-Modified of json_view pages
 	auto_redirect = False
 	auto_redirect_url = None
 	export = False
 	export_name = None
+	fast_rows = None # load only list_display's columns when they're all plain fields, False to turn off
+	export_formats = ('csv',) # any of exporters.EXPORTERS, each added as an action
+	export_chunk_size = 500
+	export_processes = None # format exports on this many worker processes, see parallel.py
+	export_worker_chunk_size = 10000 # rows per task handed to a worker process
+	export_background_threshold = None # row count above which exports run as background jobs
+	export_runner = 'thread' # 'database' or a runner instance from jobs.py
+	export_status_url = None # e.g. '/reports/exports/%s/', routed to jobs.export_status
 
 	def __init__(self,queryset,display_set_site,*args,**kwargs):
 		self.filtered_queryset = queryset
-		if self.export:
-			self.actions.append(csv_export)
-		if self.list_display != None:
-			self.list_display = list(self.list_display)
+		self.timings = get_timings(self.__class__)
+		if self.page_cache and self.page_cache_invalidate_on_save:
+			pagecache.invalidate_on_save(queryset.model)
+		config = get_display_config(self.__class__)
+		self.export_actions = config.export_actions
+		if config.list_display != None:
+			if not self.list_display_links:
+				# link the first of the class's own columns, not a default one
+				for name in self.list_display:
+					if name != 'action_checkbox':
+						self.list_display_links = [name]
+						break
+			self.list_display = list(config.list_display)
 
 		super(DisplaySet,self).__init__(queryset.model,display_set_site)
 
-		if not self.actions and 'action_checkbox' in self.list_display:
+		if not self.actions and not self.export_actions and 'action_checkbox' in self.list_display:
 			self.list_display.remove('action_checkbox')
 
 	def get_changelist(self,request):
-		DisplayList.filtered_queryset = self.filtered_queryset
-		DisplayList.after_pagination_select_related = self.after_pagination_select_related
 		return DisplayList
 
+	def get_actions(self, request):
+		"The admin's actions, plus an export action for each of export_formats."
+		actions = super(DisplaySet,self).get_actions(request)
+		if self.actions is None or not isinstance(actions, dict):
+			return actions
+		for action in self.export_actions:
+			func, name, description = self.get_action(action)
+			actions[name] = (func, name, description)
+		return actions
+
 	def queryset(self, request):
 		return self.filtered_queryset
+
+	def export_in_background(self, request, queryset, format='csv', batches=None):
+		"""
+		Queues an export of queryset, or of the batches of selected pks of it,
+		with export_runner and tells the user where to find it.
+		"""
+		pks = None
+		if batches is not None:
+			pks = [pk for batch in batches for pk in batch]
+		spec = serialize_export(self, queryset, format, pks)
+		job_id = get_export_runner(self.export_runner).submit(spec, request.user)
+		if self.export_status_url:
+			msg = "Your export is being prepared. It will be available at %s" % (self.export_status_url % job_id)
+		else:
+			msg = "Your export is being prepared (job %s)." % job_id
+		self.message_user(request, msg)
+
+	def get_page_cache_key(self, request):
+		"""
+		The cache key of this changelist page, or None to skip the cache.
+		Override it if the page depends on anything beyond the queryset, the
+		query string and the user.
+		"""
+		return pagecache.page_key(self, request)
+
+	def get_aggregates(self, queryset):
+		"Returns ({field: value}, count) of list_aggregates over queryset."
+		timeout = None
+		if self.count_strategy == 'cached':
+			timeout = self.count_cache_timeout
+		return aggregates.get_aggregates(queryset, self.list_aggregates, timeout)
+
+	def get_search_backend(self):
+		"Returns the backend DisplayList searches search_fields with."
+		if self.search_backend == 'orm':
+			return ORMSearch(self.search_distinct_fields)
+		elif self.search_backend == 'prefix':
+			return PrefixSearch(self.search_distinct_fields)
+		return self.search_backend
+
+	def get_count_strategy(self):
+		"Returns the callable DisplayList uses to count results."
+		if self.count_strategy == 'exact':
+			return ExactCount()
+		elif self.count_strategy == 'cached':
+			return CachedCount(self.count_cache_timeout)
+		elif self.count_strategy == 'estimated':
+			return EstimatedCount(self.count_estimate_threshold)
+		return self.count_strategy
 	#<<<<
 
+	def run_action(self, func, request, queryset, selected=None):
+		"""
+		Calls an action with queryset, or with the selected pks of it, in the
+		form the action asks for:
+
+		  func.set_based = True -- querysets without ordering or DISTINCT, fit
+		  for update() and delete(), one per batch of action_batch_size pks;
+		  func.row_based = True -- a generator of the objects, read with
+		  iterator() one batch of pks at a time;
+		  func.batched = True -- the queryset and, as batches, the selected
+		  pks cut into batches, None when acting on the whole queryset;
+		  otherwise -- the queryset, as the admin does.
+
+		Batching keeps each query within the database's parameter limits.
+		"""
+		batches = None
+		if selected:
+			size = self.action_batch_size
+			batches = [selected[i:i+size] for i in range(0, len(selected), size)]
+
+		if getattr(func, 'set_based', False):
+			queryset = queryset.order_by()
+			queryset.query.distinct = False
+			if batches is None:
+				return func(self, request, queryset)
+			response = None
+			for batch in batches:
+				response = func(self, request, queryset.filter(pk__in=batch)) or response
+			return response
+
+		if getattr(func, 'row_based', False):
+			return func(self, request, iterate_batches(queryset, batches))
+
+		if getattr(func, 'batched', False):
+			return func(self, request, queryset, batches=batches)
+
+		if selected:
+			queryset = queryset.filter(pk__in=selected)
+		return func(self, request, queryset)
+
+	def use_bulk_edit(self):
+		"""
+		Whether list_editable saves go through bulkedit.save_changed_forms.
+		Left as None, they do unless save_model or log_change is overridden,
+		or the model's save() is, or it has pre_save or post_save receivers.
+		"""
+		if self.list_editable_bulk is not None:
+			return self.list_editable_bulk
+		return (self.__class__.save_model == adminoptions.ModelAdmin.save_model and
+			self.__class__.log_change == adminoptions.ModelAdmin.log_change and
+			saves_are_plain(self.model))
+
 	def response_action(self, request, queryset):
 		"""
 		Handle an admin action. This is called if a request is POSTed to the
@@ -432,9 +821,9 @@ class DisplaySet(adminoptions.ModelAdmin):
 			selected = request.POST.getlist(helpers.ACTION_CHECKBOX_NAME)
 			if not select_across and selected:
 				# Perform the action only on the selected objects
-				queryset = queryset.filter(pk__in=selected)
-
-			response = func(self, request, queryset)
+				response = self.run_action(func, request, queryset, selected)
+			else:
+				response = self.run_action(func, request, queryset)
 
 			# Actions may return an HttpResponse, which will be used as the
 			# response from the POST. If not, we'll be a good little HTTP
@@ -449,6 +838,33 @@ class DisplaySet(adminoptions.ModelAdmin):
 
 	def changelist_view(self, request, extra_context=None):
 		"The 'change list' admin view for this model."
+		if self.page_cache and request.method == 'GET':
+			response = pagecache.get_page(self, request)
+			if response is not None:
+				return self.timings.finish(self, request, response)
+
+		response = self.changelist_response(request, extra_context)
+
+		if self.page_cache:
+			if request.method == 'POST':
+				# actions and list_editable saves may have changed what's shown
+				pagecache.invalidate(self.model)
+			elif request.method == 'GET':
+				pagecache.set_page(self, request, response)
+		return self.timings.finish(self, request, response)
+
+	def json_view(self, request):
+		"The changelist page as JSON, see jsonview.py."
+		list_display = [f for f in self.list_display if f != 'action_checkbox']
+		ChangeList = self.get_changelist(request)
+		try:
+			cl = ChangeList(request, self.model, list_display, self.list_display_links, self.list_filter,
+				self.date_hierarchy, self.search_fields, self.list_select_related, self.list_per_page, self.list_editable, self)
+		except adminoptions.IncorrectLookupParameters:
+			return HttpResponseBadRequest()
+		return self.timings.finish(self, request, json_response(self, request, cl))
+
+	def changelist_response(self, request, extra_context=None):
 		from django.contrib.admin.views.main import ERROR_FLAG
 		opts = self.model._meta
 		app_label = opts.app_label
@@ -464,32 +880,34 @@ class DisplaySet(adminoptions.ModelAdmin):
 			except ValueError:
 				pass
 
+		timings = self.timings
 		ChangeList = self.get_changelist(request)
-		try:
-			cl = ChangeList(request, self.model, list_display, self.list_display_links, self.list_filter,
-				self.date_hierarchy, self.search_fields, self.list_select_related, self.list_per_page, self.list_editable, self)
-		except adminoptions.IncorrectLookupParameters:
-			# Wacky lookup parameters were given, so redirect to the main
-			# changelist page, without parameters, and pass an 'invalid=1'
-			# parameter via the query string. If wacky parameters were given
-			# and the 'invalid=1' parameter was already in the query string,
-			# something is screwed up with the database, so display an error
-			# page.
-			if ERROR_FLAG in request.GET.keys():
-				return render_to_response('admin/invalid_setup.html', {'title': ('Database error')})
-			return HttpResponseRedirect(request.path + '?' + ERROR_FLAG + '=1')
+		with timings.phase('changelist'):
+			try:
+				cl = ChangeList(request, self.model, list_display, self.list_display_links, self.list_filter,
+					self.date_hierarchy, self.search_fields, self.list_select_related, self.list_per_page, self.list_editable, self)
+			except adminoptions.IncorrectLookupParameters:
+				# Wacky lookup parameters were given, so redirect to the main
+				# changelist page, without parameters, and pass an 'invalid=1'
+				# parameter via the query string. If wacky parameters were given
+				# and the 'invalid=1' parameter was already in the query string,
+				# something is screwed up with the database, so display an error
+				# page.
+				if ERROR_FLAG in request.GET.keys():
+					return render_to_response('admin/invalid_setup.html', {'title': ('Database error')})
+				return HttpResponseRedirect(request.path + '?' + ERROR_FLAG + '=1')
 		#<<<<
 		# if auto_redirect is true we should handle that before anything else
-		if self.auto_redirect and cl.query_set.count() == 1:
-
-			obj = cl.query_set[0]
-			try:
-				url = obj.get_absolute_url()
-			except AttributeError:
-				url = None
+		if self.auto_redirect and request.method == 'GET':
+			obj = cl.get_single_result()
+			if obj is not None:
+				try:
+					url = obj.get_absolute_url()
+				except AttributeError:
+					url = None
 
-			if url: # if no url just go ahead and show the display set normally
-				return HttpResponseRedirect(url)
+				if url: # if no url just go ahead and show the display set normally
+					return HttpResponseRedirect(url)
 		#<<<<
 
 		# If the request was POSTed, this might be a bulk action or a bulk
@@ -501,7 +919,8 @@ class DisplaySet(adminoptions.ModelAdmin):
 
 		# Actions with no confirmation
 		if actions and request.method == 'POST':
-			response = self.response_action(request, queryset=cl.get_query_set())
+			with timings.phase('actions'):
+				response = self.response_action(request, queryset=cl.query_set)
 			if response:
 				return response
 
@@ -517,14 +936,20 @@ class DisplaySet(adminoptions.ModelAdmin):
 			formset = cl.formset = FormSet(request.POST, request.FILES, queryset=cl.result_list)
 			if formset.is_valid():
 				changecount = 0
-				for form in formset.forms:
-					if form.has_changed():
-						obj = self.save_form(request, form, change=True)
-						self.save_model(request, obj, form, change=True)
-						form.save_m2m()
-						change_msg = self.construct_change_message(request, form, None)
-						self.log_change(request, obj, change_msg)
-						changecount += 1
+				if self.use_bulk_edit():
+					saved = save_changed_forms(self, request, formset)
+					changecount = len(saved)
+					if saved:
+						obj = saved[-1]
+				else:
+					for form in formset.forms:
+						if form.has_changed():
+							obj = self.save_form(request, form, change=True)
+							self.save_model(request, obj, form, change=True)
+							form.save_m2m()
+							change_msg = self.construct_change_message(request, form, None)
+							self.log_change(request, obj, change_msg)
+							changecount += 1
 
 				if changecount:
 					if changecount == 1:
@@ -573,10 +998,19 @@ class DisplaySet(adminoptions.ModelAdmin):
 			'actions_selection_counter': self.actions_selection_counter,
 		}
 		context.update(extra_context or {})
+		if timings.enabled and self.timings_context_name:
+			context[self.timings_context_name] = timings
 		context_instance = template.RequestContext(request, current_app=self.admin_site.name)
-		return render_to_response(self.change_list_template or [
-			'admin/%s/%s/change_list.html' % (app_label, opts.object_name.lower()),
-			'admin/%s/change_list.html' % app_label,
-			'admin/change_list.html'
-		], context, context_instance=context_instance)
+		if timings.enabled:
+			# results are loaded on first use, so load them here to keep them
+			# out of the render phase
+			with timings.phase('results'):
+				len(cl.result_list)
+				cl.aggregate_row
+		with timings.phase('render'):
+			return render_to_response(self.change_list_template or [
+				'admin/%s/%s/change_list.html' % (app_label, opts.object_name.lower()),
+				'admin/%s/change_list.html' % app_label,
+				'admin/change_list.html'
+			], context, context_instance=context_instance)
 
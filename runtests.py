@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+"Runs the django_displayset tests: python runtests.py [test labels]"
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'displayset_tests.settings')
+
+def main(labels):
+	from django.conf import settings
+	from django.test.utils import get_runner
+	runner = get_runner(settings)(verbosity=1, interactive=False)
+	return runner.run_tests(labels or ['displayset_tests'])
+
+if __name__ == '__main__':
+	sys.exit(bool(main(sys.argv[1:])))
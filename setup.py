@@ -9,7 +9,7 @@ setup(
     author_email='subsume@gmail.com',
     description='Admin-like display of querysets in django',
     url='http://github.com/subsume/django-displayset',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'displayset_tests']),
     include_package_data=True,
     classifiers=[
         "Framework :: Django",